@@ -0,0 +1,139 @@
+"""Admission control of tool calls forwarded to the upstream MCP server.
+
+Every tool call needs a slot of its tool's concurrency limit (if it has one) and a slot of the global
+limit. Calls that find no free slot wait in a bounded queue; when the queue is full or a call waits for
+longer than the queue timeout, the call is rejected right away instead of piling up on the upstream.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import time
+from typing import TYPE_CHECKING
+
+from .const import TOOL_CALL_MAX_QUEUED, TOOL_CALL_QUEUE_TIMEOUT_SECS, TOOL_MAX_CONCURRENT_CALLS
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+
+class ToolOverloadedError(Exception):
+    """Raised when a tool call is rejected because its concurrency limit is exhausted."""
+
+
+class ConcurrencyLimit:
+    """Limit of concurrent calls with a bounded wait queue.
+
+    Attributes:
+        name: Name of the limit used in error messages (the tool name, or 'global')
+        limit: Maximum number of concurrent calls
+        max_queued: Maximum number of calls waiting for a free slot
+        active: Number of calls currently holding a slot
+        queued: Number of calls currently waiting for a slot (queue depth)
+        admitted: Number of calls that got a slot
+        rejected: Number of calls rejected because the queue was full or the wait timed out
+        total_wait_secs: Total time admitted calls spent waiting for a slot
+        max_wait_secs: Longest time an admitted call spent waiting for a slot
+    """
+
+    def __init__(self, name: str, limit: int, max_queued: int) -> None:
+        self.name = name
+        self.limit = limit
+        self.max_queued = max_queued
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait_secs = 0.0
+        self.max_wait_secs = 0.0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self, deadline: float) -> None:
+        """Take a slot, waiting at most until the `deadline` (monotonic timestamp) for one to free up."""
+        if self._semaphore.locked():
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                raise ToolOverloadedError(f"Too many calls waiting for '{self.name}' (limit {self.limit})")
+            self.queued += 1
+            started_at = time.monotonic()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), max(deadline - started_at, 0))
+            except TimeoutError:
+                self.rejected += 1
+                raise ToolOverloadedError(f"Timed out waiting for a free slot of '{self.name}'") from None
+            finally:
+                self.queued -= 1
+            wait_secs = time.monotonic() - started_at
+            self.total_wait_secs += wait_secs
+            self.max_wait_secs = max(self.max_wait_secs, wait_secs)
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        self.admitted += 1
+
+    def release(self) -> None:
+        """Free a slot taken by `acquire`."""
+        self.active -= 1
+        self._semaphore.release()
+
+
+class ToolAdmissionControl:
+    """Per-tool and global concurrency limits of tool calls.
+
+    Attributes:
+        tool_limits: Concurrency limits of individual tools, by tool name
+        global_limit: Concurrency limit shared by all tool calls
+    """
+
+    def __init__(
+        self,
+        tool_limits: dict[str, int] | None = None,
+        max_concurrent_calls: int = TOOL_MAX_CONCURRENT_CALLS,
+        max_queued: int = TOOL_CALL_MAX_QUEUED,
+        queue_timeout_secs: float = TOOL_CALL_QUEUE_TIMEOUT_SECS,
+    ) -> None:
+        """Initialize the admission control.
+
+        Args:
+            tool_limits: Optional dict mapping tool names to their maximum number of concurrent calls
+            max_concurrent_calls: Maximum number of concurrent calls of all tools together
+            max_queued: Maximum number of calls waiting for a free slot, per limit
+            queue_timeout_secs: Maximum time in seconds a call waits for free slots before it is rejected
+        """
+        self.queue_timeout_secs = queue_timeout_secs
+        self.tool_limits = {
+            tool_name: ConcurrencyLimit(tool_name, limit, max_queued)
+            for tool_name, limit in (tool_limits or {}).items()
+        }
+        self.global_limit = ConcurrencyLimit('global', max_concurrent_calls, max_queued)
+
+    @property
+    def limits(self) -> list[ConcurrencyLimit]:
+        """All concurrency limits, the global one last."""
+        return [*self.tool_limits.values(), self.global_limit]
+
+    @property
+    def queue_depths(self) -> dict[str, int]:
+        """Number of calls waiting for a slot, by limit name."""
+        return {limit.name: limit.queued for limit in self.limits}
+
+    @contextlib.asynccontextmanager
+    async def admit(self, tool_name: str) -> AsyncIterator[None]:
+        """Hold slots of the tool's and the global limit for the duration of the call.
+
+        Raises:
+            ToolOverloadedError: If no slot frees up within the queue timeout or the wait queue is full
+        """
+        deadline = time.monotonic() + self.queue_timeout_secs
+        # Take the tool's slot first, so that calls waiting for a busy tool do not block other tools
+        limits = [limit for limit in (self.tool_limits.get(tool_name), self.global_limit) if limit is not None]
+        acquired: list[ConcurrencyLimit] = []
+        try:
+            for limit in limits:
+                await limit.acquire(deadline)
+                acquired.append(limit)
+            yield
+        finally:
+            for limit in reversed(acquired):
+                limit.release()
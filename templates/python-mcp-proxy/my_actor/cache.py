@@ -0,0 +1,275 @@
+"""Caches used by the proxy to avoid repeated round trips to the upstream MCP server and other remote services."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, TypeVar
+
+import httpx
+from mcp import types
+
+from .const import (
+    LIST_CACHE_TTL_SECS,
+    REMOTE_DOCUMENT_CACHE_TTL_SECS,
+    TOOL_RESULT_CACHE_MAX_BYTES,
+    TOOL_RESULT_CACHE_MAX_ENTRIES,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Hashable
+
+    from mcp.shared.session import RequestResponder
+
+logger = logging.getLogger('apify')
+
+T = TypeVar('T')
+
+# Upstream list-changed notifications and the list requests whose results they invalidate
+LIST_CHANGED_NOTIFICATIONS: dict[type, tuple[type, ...]] = {
+    types.ToolListChangedNotification: (types.ListToolsRequest,),
+    types.PromptListChangedNotification: (types.ListPromptsRequest,),
+    types.ResourceListChangedNotification: (types.ListResourcesRequest, types.ListResourceTemplatesRequest),
+}
+
+
+class ListResultCache:
+    """Cache of (already filtered) list results of the upstream server.
+
+    Entries are keyed by the list request type and expire after `ttl_secs`. They are also invalidated
+    as soon as the upstream server sends the corresponding `notifications/*/list_changed`; for that,
+    pass `handle_upstream_message` as the `message_handler` of the upstream `ClientSession`.
+
+    Attributes:
+        hits: Number of lookups served from the cache
+        misses: Number of lookups that had to load the result from the upstream server
+    """
+
+    def __init__(self, ttl_secs: float = LIST_CACHE_TTL_SECS) -> None:
+        """Initialize the cache.
+
+        Args:
+            ttl_secs: Time in seconds after which a cached list result expires
+        """
+        self.ttl_secs = ttl_secs
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry as monotonic timestamp, cached result)
+        self._entries: dict[Hashable, tuple[float, Any]] = {}
+        # Incremented on every invalidation; results loaded across an invalidation are not cached
+        self._generation = 0
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        """Return the cached result for `key`, loading and caching it with `loader` if missing or expired."""
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        generation = self._generation
+        result = await loader()
+        if generation == self._generation:
+            self._entries[key] = (time.monotonic() + self.ttl_secs, result)
+        return result
+
+    def invalidate(self, *request_types: type) -> None:
+        """Drop cached results of the given list request types, or of all of them if none are given."""
+        self._generation += 1
+        if not request_types:
+            self._entries.clear()
+            return
+        for key in list(self._entries):
+            if (key[0] if isinstance(key, tuple) else key) in request_types:
+                del self._entries[key]
+
+    async def handle_upstream_message(
+        self,
+        message: RequestResponder[types.ServerRequest, types.ClientResult] | types.ServerNotification | Exception,
+    ) -> None:
+        """Invalidate cached results when the upstream server reports that a list has changed."""
+        if not isinstance(message, types.ServerNotification):
+            return
+        if request_types := LIST_CHANGED_NOTIFICATIONS.get(type(message.root)):
+            logger.debug(f'Upstream sent {message.root.method}, invalidating cached list results')
+            self.invalidate(*request_types)
+
+
+class ToolResultCache:
+    """LRU cache of results of idempotent (read-only) tool calls.
+
+    Only tools listed in `tool_config` are cached. Entries are keyed by the tool name and canonicalized
+    arguments, expire after the tool's TTL, and the least recently used entries are evicted when either
+    `max_entries` or `max_bytes` is exceeded. Error results are never cached.
+
+    Attributes:
+        hits: Number of tool calls served from the cache
+        misses: Number of cacheable tool calls that had to be forwarded to the upstream server
+        evictions: Number of entries evicted to stay within the size limits
+        size_bytes: Total size of the cached results, in bytes of their JSON serialization
+    """
+
+    def __init__(
+        self,
+        tool_config: dict[str, tuple[float, bool]],
+        max_entries: int = TOOL_RESULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = TOOL_RESULT_CACHE_MAX_BYTES,
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            tool_config: Dict mapping names of cacheable tools to (ttl_secs, charge_on_hit) tuples
+            max_entries: Maximum number of cached results
+            max_bytes: Maximum total size of cached results, in bytes
+        """
+        self.tool_config = tool_config
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        # (tool name, canonical arguments) -> (expiry as monotonic timestamp, result, size)
+        self._entries: OrderedDict[tuple[str, str], tuple[float, types.CallToolResult, int]] = OrderedDict()
+
+    @staticmethod
+    def _make_key(tool_name: str, arguments: dict[str, Any]) -> tuple[str, str]:
+        return tool_name, json.dumps(arguments, sort_keys=True, separators=(',', ':'), default=str)
+
+    def charges_on_hit(self, tool_name: str) -> bool:
+        """Return whether a call of the tool served from the cache is charged."""
+        return self.tool_config.get(tool_name, (0, True))[1]
+
+    def get(self, tool_name: str, arguments: dict[str, Any]) -> types.CallToolResult | None:
+        """Return the cached result of the tool call, or None if the tool is not cacheable or not cached."""
+        if tool_name not in self.tool_config:
+            return None
+
+        key = self._make_key(tool_name, arguments)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, tool_name: str, arguments: dict[str, Any], result: types.CallToolResult) -> None:
+        """Cache the result of a tool call if the tool is cacheable and the result is not an error."""
+        if tool_name not in self.tool_config or result.isError:
+            return
+
+        size = len(result.model_dump_json(by_alias=True, exclude_none=True))
+        if size > self.max_bytes:
+            return
+
+        key = self._make_key(tool_name, arguments)
+        if key in self._entries:
+            self._remove(key)
+        ttl_secs, _ = self.tool_config[tool_name]
+        self._entries[key] = (time.monotonic() + ttl_secs, result, size)
+        self.size_bytes += size
+
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: tuple[str, str]) -> None:
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
+
+
+class RemoteDocument:
+    """A cached copy of a remote document together with its validators."""
+
+    def __init__(self, body: bytes, etag: str, upstream_etag: str | None, expires_at: float) -> None:
+        self.body = body
+        self.etag = etag  # ETag of the body as served by the proxy
+        self.upstream_etag = upstream_etag  # ETag sent by the remote server, used for conditional GETs
+        self.expires_at = expires_at
+
+
+class RemoteDocumentCache:
+    """Cache of a remote document (e.g. OAuth metadata) served by the proxy on behalf of the remote server.
+
+    A fresh copy is served without contacting the remote server. Once it expires, the stale copy is still
+    served while a single background request revalidates it with a conditional GET; if that fails, the
+    stale copy keeps being served. The remote server is only awaited when there is no copy at all.
+
+    Attributes:
+        fetches: Number of requests sent to the remote server
+        not_modified: Number of revalidations answered with 304 Not Modified
+    """
+
+    def __init__(self, url: str, ttl_secs: float = REMOTE_DOCUMENT_CACHE_TTL_SECS) -> None:
+        """Initialize the cache.
+
+        Args:
+            url: URL of the remote document
+            ttl_secs: Time in seconds for which a copy is served without revalidation
+        """
+        self.url = url
+        self.ttl_secs = ttl_secs
+        self.fetches = 0
+        self.not_modified = 0
+        self._document: RemoteDocument | None = None
+        self._refresh_task: asyncio.Task[RemoteDocument] | None = None
+        # Shared across requests, so connections to the remote server are reused
+        self._client: httpx.AsyncClient | None = None
+
+    async def get(self) -> RemoteDocument:
+        """Return the cached document, fetching it if there is no copy yet and revalidating it if stale."""
+        document = self._document
+        if document is None:
+            return await asyncio.shield(self._refresh())
+        if document.expires_at <= time.monotonic():
+            self._refresh()
+        return document
+
+    async def aclose(self) -> None:
+        """Close the HTTP client used to fetch the document."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _refresh(self) -> asyncio.Task[RemoteDocument]:
+        """Start fetching the document, unless a fetch is already in progress."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._fetch())
+            self._refresh_task.add_done_callback(self._log_refresh_failure)
+        return self._refresh_task
+
+    def _log_refresh_failure(self, task: asyncio.Task[RemoteDocument]) -> None:
+        if not task.cancelled() and (error := task.exception()) and self._document is not None:
+            logger.warning(f'Failed to revalidate {self.url}, serving the stale copy: {error}')
+
+    async def _fetch(self) -> RemoteDocument:
+        if self._client is None:
+            self._client = httpx.AsyncClient()
+        headers = {}
+        if self._document is not None and self._document.upstream_etag:
+            headers['If-None-Match'] = self._document.upstream_etag
+
+        self.fetches += 1
+        response = await self._client.get(self.url, headers=headers)
+        if response.status_code == httpx.codes.NOT_MODIFIED and self._document is not None:
+            self.not_modified += 1
+            self._document.expires_at = time.monotonic() + self.ttl_secs
+            return self._document
+
+        response.raise_for_status()
+        body = response.content
+        self._document = RemoteDocument(
+            body=body,
+            etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            upstream_etag=response.headers.get('etag'),
+            expires_at=time.monotonic() + self.ttl_secs,
+        )
+        return self._document
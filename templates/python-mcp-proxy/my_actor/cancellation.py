@@ -0,0 +1,151 @@
+"""Cancellation of upstream requests whose results will not be read.
+
+A request of the proxy to the upstream MCP server stops being useful when the client cancels it (with
+`notifications/cancelled`), when it exceeds its tool's deadline, or when the client session it was made for
+is closed (by DELETE or by the idle session reaper). In all these cases the awaiting task is cancelled, and
+the client session of the proxy tells the upstream server to stop working on the request as well.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+import math
+from typing import TYPE_CHECKING, Any
+
+import anyio
+import httpx
+from mcp import types
+from mcp.client.session import ClientSession
+from mcp.shared.exceptions import McpError
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+logger = logging.getLogger('apify')
+
+CANCEL_NOTIFICATION_TIMEOUT_SECS = 5  # Longest wait for a cancellation notification to be sent upstream
+
+
+class CancellingClientSession(ClientSession):
+    """Client session sending `notifications/cancelled` for requests that are cancelled or time out.
+
+    Attributes:
+        cancelled_requests: Number of requests the upstream server was told to stop working on
+        protocol_version: MCP protocol version negotiated with the upstream server, once initialized
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.cancelled_requests = 0
+        self.protocol_version: str | None = None
+
+    async def initialize(self) -> types.InitializeResult:
+        """Initialize the session and record the negotiated protocol version."""
+        result = await super().initialize()
+        self.protocol_version = str(result.protocolVersion)
+        return result
+
+    async def send_request(self, request: types.ClientRequest, *args: Any, **kwargs: Any) -> Any:
+        """Send a request; if it is cancelled or times out, notify the server before the error is raised."""
+        # The ID assigned to the request by the base class
+        request_id = self._request_id
+        try:
+            return await super().send_request(request, *args, **kwargs)
+        except anyio.get_cancelled_exc_class():
+            await self._send_cancelled(request, request_id, 'The request was cancelled')
+            raise
+        except McpError as e:
+            if e.error.code == httpx.codes.REQUEST_TIMEOUT:
+                await self._send_cancelled(request, request_id, 'The request timed out')
+            raise
+
+    async def _send_cancelled(self, request: types.ClientRequest, request_id: int, reason: str) -> None:
+        # The initialization request must not be cancelled
+        if isinstance(request.root, types.InitializeRequest):
+            return
+        notification = types.CancelledNotification(
+            params=types.CancelledNotificationParams(requestId=request_id, reason=reason),
+        )
+        # Shielded, as the notification is usually sent from a cancelled task
+        with anyio.move_on_after(CANCEL_NOTIFICATION_TIMEOUT_SECS, shield=True):
+            try:
+                await self.send_notification(types.ClientNotification(notification))
+                self.cancelled_requests += 1
+            except Exception as e:
+                # The connection may be gone already, in which case there is nothing to cancel
+                logger.debug(f'Failed to send cancellation of request {request_id} upstream: {e!r}')
+
+
+class TrackedCall:
+    """An upstream call tracked by `InFlightCalls`.
+
+    Attributes:
+        timeout_secs: Deadline of the call in seconds from its start, or None if it has none
+        cancel_reason: Why the call was stopped ('timeout' or 'session_closed'), or None if it was not
+    """
+
+    __slots__ = ('cancel_reason', 'scope', 'timeout_secs')
+
+    def __init__(self, timeout_secs: float | None) -> None:
+        self.timeout_secs = timeout_secs
+        self.cancel_reason: str | None = None
+        deadline = anyio.current_time() + timeout_secs if timeout_secs else math.inf
+        self.scope = anyio.CancelScope(deadline=deadline)
+
+    def error_message(self, tool_name: str) -> str:
+        """Return the message of the error result the client gets for the stopped call."""
+        if self.cancel_reason == 'timeout':
+            return f"The tool '{tool_name}' did not finish within {self.timeout_secs} seconds."
+        return f"The tool call of '{tool_name}' was stopped, as the session was closed."
+
+
+class InFlightCalls:
+    """Upstream tool calls in flight, by the key of the client session they were made for.
+
+    Attributes:
+        tool_timeouts: Deadlines of tool calls in seconds, by tool name
+        timed_out: Number of calls stopped because they exceeded their deadline
+        aborted: Number of calls stopped because their client session was closed
+        cancelled: Number of calls cancelled by the client
+    """
+
+    def __init__(self, tool_timeouts: dict[str, float] | None = None) -> None:
+        self.tool_timeouts = tool_timeouts or {}
+        self.timed_out = 0
+        self.aborted = 0
+        self.cancelled = 0
+        # session key -> calls made for the session
+        self._calls: dict[str, set[TrackedCall]] = {}
+
+    @contextlib.contextmanager
+    def track(self, session_key: str, tool_name: str) -> Iterator[TrackedCall]:
+        """Run the body as a call of the tool that is stopped at its deadline or when the session is closed.
+
+        A stopped call leaves the body without an error; its `cancel_reason` tells why it was stopped.
+        """
+        call = TrackedCall(self.tool_timeouts.get(tool_name))
+        calls = self._calls.setdefault(session_key, set())
+        calls.add(call)
+        try:
+            with call.scope:
+                yield call
+        except anyio.get_cancelled_exc_class():
+            self.cancelled += 1
+            raise
+        finally:
+            calls.discard(call)
+            if not calls and self._calls.get(session_key) is calls:
+                del self._calls[session_key]
+        if call.scope.cancelled_caught and call.cancel_reason is None:
+            call.cancel_reason = 'timeout'
+            self.timed_out += 1
+
+    def abort_session(self, session_key: str) -> int:
+        """Stop all calls made for a closed session and return how many were stopped."""
+        calls = self._calls.pop(session_key, set())
+        for call in calls:
+            call.cancel_reason = 'session_closed'
+            call.scope.cancel()
+        self.aborted += len(calls)
+        return len(calls)
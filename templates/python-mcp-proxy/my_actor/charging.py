@@ -0,0 +1,151 @@
+"""Batched charging of MCP operations.
+
+Charging an event with `Actor.charge` is a round trip to the Apify platform. Instead of awaiting it for
+every tool call, charges are recorded in memory, merged per event name and sent by a background task
+once enough events are pending or the flush interval elapses. Pending charges are flushed when the
+server shuts down.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Any
+
+from .const import CHARGE_FLUSH_INTERVAL_SECS, CHARGE_FLUSH_MAX_PENDING_EVENTS, CHARGE_MAX_RETRIES
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger('apify')
+
+MAX_RETRY_DELAY_SECS = 10
+
+
+class ChargeAggregator:
+    """Record charges in memory and send them to the charge function in merged batches.
+
+    A batch is taken out of the pending counts when a flush starts. Counts of an event are recorded as
+    charged only after the charge function returned for them; if it keeps failing (or the flush is
+    cancelled), the counts are put back to pending and sent with the next flush. So every recorded
+    event is charged exactly once as long as a failed call of the charge function did not charge.
+
+    Attributes:
+        pending: Counts of recorded events not charged yet, by event name
+        charged: Counts of events successfully charged, by event name
+        failed_calls: Number of calls of the charge function that raised an exception
+    """
+
+    def __init__(
+        self,
+        charge_function: Callable[[str, int], Awaitable[Any]],
+        flush_interval_secs: float = CHARGE_FLUSH_INTERVAL_SECS,
+        max_pending_events: int = CHARGE_FLUSH_MAX_PENDING_EVENTS,
+        max_retries: int = CHARGE_MAX_RETRIES,
+    ) -> None:
+        """Initialize the aggregator.
+
+        Args:
+            charge_function: Function charging an event, accepting (event_name: str, count: int).
+                Typically, Actor.charge in Apify Actors.
+            flush_interval_secs: Maximum time in seconds a recorded charge waits before it is sent
+            max_pending_events: Number of pending events that triggers a flush before the interval elapses
+            max_retries: Number of retries of a failed charge within a single flush
+        """
+        self.charge_function = charge_function
+        self.flush_interval_secs = flush_interval_secs
+        self.max_pending_events = max_pending_events
+        self.max_retries = max_retries
+        self.pending: Counter[str] = Counter()
+        self.charged: Counter[str] = Counter()
+        self.failed_calls = 0
+        # Monotonic timestamp of the oldest pending charge, None if nothing is pending
+        self._oldest_pending: float | None = None
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    @property
+    def flush_lag_secs(self) -> float:
+        """Age in seconds of the oldest charge that has not been sent yet."""
+        return 0.0 if self._oldest_pending is None else time.monotonic() - self._oldest_pending
+
+    def record(self, event_name: str, count: int = 1) -> None:
+        """Record a charge to be sent with the next flush."""
+        self.pending[event_name] += count
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+        if self.pending.total() >= self.max_pending_events:
+            self._flush_requested.set()
+
+    async def charge(self, event_name: str, count: int = 1) -> None:
+        """Record a charge; drop-in replacement for the charge function that returns immediately."""
+        self.record(event_name, count)
+
+    def start(self) -> None:
+        """Start the background flush task."""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background flush task and flush all pending charges."""
+        self._stopping = True
+        self._flush_requested.set()
+        if self._task is not None:
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+        if self.pending:
+            logger.error(f'Failed to charge events before shutdown: {dict(self.pending)}')
+
+    async def flush(self) -> None:
+        """Send all pending charges, merged per event name."""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, Counter()
+            batch_since, self._oldest_pending = self._oldest_pending, None
+            charged: set[str] = set()
+            try:
+                for event_name, count in batch.items():
+                    if await self._charge_with_retries(event_name, count):
+                        charged.add(event_name)
+            finally:
+                # Put back whatever was not charged, so it is sent with the next flush
+                if uncharged := {name: count for name, count in batch.items() if name not in charged}:
+                    self.pending.update(uncharged)
+                    self._oldest_pending = min(filter(None, (batch_since, self._oldest_pending)), default=None)
+
+    async def _charge_with_retries(self, event_name: str, count: int) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.charge_function(event_name, count)
+            except Exception:
+                self.failed_calls += 1
+                if attempt == self.max_retries:
+                    logger.exception(f'Failed to charge {count} x {event_name}, will retry with the next flush')
+                    return False
+                delay = min(2**attempt, MAX_RETRY_DELAY_SECS)
+                logger.warning(f'Failed to charge {count} x {event_name}, retrying in {delay}s')
+                await asyncio.sleep(delay)
+            else:
+                self.charged[event_name] += count
+                logger.info(f'Charged {count} x {event_name}')
+                return True
+        return False
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval_secs)
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Failed to flush charges')
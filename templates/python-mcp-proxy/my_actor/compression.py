@@ -0,0 +1,171 @@
+"""Response compression for the streamed /mcp endpoint.
+
+Starlette's GZipMiddleware does not compress event streams, yet results of tools like `read_paper` are sent
+to clients over SSE. This middleware negotiates zstd (when the Python build provides it) or gzip with the
+client and compresses both plain responses and event streams. Every chunk of a stream is flushed right
+away, so events reach the client as soon as they are sent.
+"""
+
+from __future__ import annotations
+
+import zlib
+from typing import TYPE_CHECKING, Any
+
+from .const import COMPRESSION_MIN_BYTES
+
+try:
+    from compression import zstd  # ty: ignore[unresolved-import]
+except ImportError:  # Python < 3.14
+    zstd = None
+
+if TYPE_CHECKING:
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+# Content encodings in order of preference
+SUPPORTED_ENCODINGS = ('zstd', 'gzip') if zstd else ('gzip',)
+# Statuses whose responses have no body to compress
+_NO_BODY_STATUSES = frozenset({204, 304})
+
+# Template of the gzip stream compressor; copying it is cheaper than setting up a new one for every response
+_GZIP_COMPRESSOR = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+# Compressor of complete responses; each response is a single frame, so it can be shared between them
+_ZSTD_COMPRESSOR = zstd.ZstdCompressor(ZSTD_LEVEL) if zstd else None
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """Return the preferred supported encoding accepted by the client, or None if there is none."""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    refused = set()
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.partition(';')
+        # Codings with q=0 are explicitly not acceptable, even if `*` is
+        if params.replace(' ', '') in {'q=0', 'q=0.0', 'q=0.00', 'q=0.000'}:
+            refused.add(coding.strip())
+        else:
+            accepted.add(coding.strip())
+    return next(
+        (
+            encoding
+            for encoding in SUPPORTED_ENCODINGS
+            if encoding in accepted or ('*' in accepted and encoding not in refused)
+        ),
+        None,
+    )
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    """Compress a complete response body."""
+    if encoding == 'zstd' and _ZSTD_COMPRESSOR is not None:
+        return _ZSTD_COMPRESSOR.compress(data, _ZSTD_COMPRESSOR.FLUSH_FRAME)
+    return zlib.compress(data, GZIP_LEVEL, wbits=16 + zlib.MAX_WBITS)
+
+
+class StreamCompressor:
+    """Compressor of a response body sent in chunks, flushing the compressed data after every chunk."""
+
+    def __init__(self, encoding: str) -> None:
+        self._zstd = zstd.ZstdCompressor(ZSTD_LEVEL) if encoding == 'zstd' and zstd else None
+        self._gzip = None if self._zstd else _GZIP_COMPRESSOR.copy()
+
+    def compress(self, data: bytes, *, last: bool) -> bytes:
+        """Compress a chunk; the last chunk also ends the compressed stream."""
+        if self._zstd is not None:
+            return self._zstd.compress(data, self._zstd.FLUSH_FRAME if last else self._zstd.FLUSH_BLOCK)
+        assert self._gzip is not None  # noqa: S101
+        return self._gzip.compress(data) + self._gzip.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Compress HTTP responses of the wrapped ASGI app with the encoding negotiated with the client.
+
+    Complete responses smaller than `minimum_size` are sent uncompressed. Event streams and other responses
+    sent in chunks are compressed regardless of their size, as it is not known up front.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_BYTES) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle the request, compressing the response if the client accepts a supported encoding."""
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = next((value for key, value in scope['headers'] if key == b'accept-encoding'), None)
+        if encoding := negotiate_encoding(accept_encoding and accept_encoding.decode('latin-1')):
+            await self.app(scope, receive, _CompressingSender(send, encoding, self.minimum_size).send)
+        else:
+            await self.app(scope, receive, send)
+
+
+class _CompressingSender:
+    """Wrapper of the ASGI `send` that compresses the response body."""
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int) -> None:
+        self._send = send
+        self._encoding = encoding
+        self._minimum_size = minimum_size
+        # The start message is held back until the first body chunk shows whether to compress
+        self._start_message: Message | None = None
+        self._compressor: StreamCompressor | None = None
+        self._passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message['type'] == 'http.response.start':
+            headers = message.get('headers', [])
+            if message['status'] in _NO_BODY_STATUSES or any(key == b'content-encoding' for key, _ in headers):
+                self._passthrough = True
+                await self._send(message)
+            elif any(key == b'content-type' and value.startswith(b'text/event-stream') for key, value in headers):
+                # Event streams may stay idle for long, so their headers are sent right away
+                self._compressor = StreamCompressor(self._encoding)
+                await self._send(self._with_encoding_headers(message, content_length=None))
+            else:
+                self._start_message = message
+            return
+        if message['type'] != 'http.response.body' or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self._compressor is not None:
+            await self._send({**message, 'body': self._compressor.compress(body, last=not more_body)})
+            return
+
+        start_message, self._start_message = self._start_message, None
+        if start_message is None:
+            await self._send(message)
+            return
+        if not more_body:
+            # The complete body is known, so small responses can be sent as they are
+            if len(body) < self._minimum_size:
+                self._passthrough = True
+                await self._send(start_message)
+                await self._send(message)
+                return
+            body = compress(self._encoding, body)
+            await self._send(self._with_encoding_headers(start_message, content_length=len(body)))
+            await self._send({**message, 'body': body})
+            return
+
+        self._compressor = StreamCompressor(self._encoding)
+        await self._send(self._with_encoding_headers(start_message, content_length=None))
+        await self._send({**message, 'body': self._compressor.compress(body, last=False)})
+
+    def _with_encoding_headers(self, start_message: Message, content_length: int | None) -> dict[str, Any]:
+        headers = [
+            (key, value)
+            for key, value in start_message.get('headers', [])
+            if key not in {b'content-length', b'content-encoding'}
+        ]
+        headers.append((b'content-encoding', self._encoding.encode()))
+        headers.append((b'vary', b'accept-encoding'))
+        if content_length is not None:
+            headers.append((b'content-length', str(content_length).encode()))
+        return {**start_message, 'headers': headers}
@@ -1,6 +1,32 @@
 from enum import StrEnum
 
 SESSION_TIMEOUT_SECS = 300  # 5 minutes
+EVENT_STORE_COMPACTION_INTERVAL_SECS = 60  # How often event store streams of ended sessions are reclaimed
+LIST_CACHE_TTL_SECS = 300  # How long tools/prompts/resources lists of the upstream server are cached
+LIST_PAGE_SIZE = 500  # Maximum number of tools/prompts/resources in a page of a list result
+PROGRESS_MAX_NOTIFICATIONS_PER_SEC = 4  # Progress notifications forwarded per second and request, at most
+COMPRESSION_MIN_BYTES = 1024  # Complete /mcp responses smaller than this are not compressed
+REMOTE_DOCUMENT_CACHE_TTL_SECS = 60 * 60  # How long OAuth metadata is served before it is revalidated
+TOOL_RESULT_CACHE_MAX_ENTRIES = 1000  # Maximum number of cached tool results (see TOOL_RESULT_CACHE)
+TOOL_RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024  # Maximum total size of cached tool results (32 MiB)
+UPSTREAM_POOL_SIZE = 1  # Number of stdio MCP server processes; more than 1 runs them as a load-balanced pool
+UPSTREAM_HEALTH_CHECK_INTERVAL_SECS = 30  # How often pooled stdio MCP server processes are pinged
+UPSTREAM_POOL_READY_TIMEOUT_SECS = 60  # Maximum time to wait for a pooled stdio MCP server process to be initialized
+UPSTREAM_NAMESPACE_SEPARATOR = '__'  # Separates the server name from tool and prompt names with multiple servers
+CHARGE_FLUSH_INTERVAL_SECS = 5  # Maximum time a recorded charge waits before it is sent to the platform
+CHARGE_FLUSH_MAX_PENDING_EVENTS = 100  # Number of pending charged events that triggers an earlier flush
+TOOL_MAX_CONCURRENT_CALLS = 32  # Maximum number of tool calls forwarded to the MCP server at the same time
+TOOL_CALL_MAX_QUEUED = 64  # Maximum number of tool calls waiting for a free slot (see TOOL_CONCURRENCY_LIMITS)
+TOOL_CALL_QUEUE_TIMEOUT_SECS = 30  # Maximum time a tool call waits for a free slot before it is rejected
+CHARGE_MAX_RETRIES = 3  # Retries of a failed charge before it is left for the next flush
+UPSTREAM_HEDGE_PERCENTILE = 95  # Percentile of recent latencies after which a hedged request is sent
+UPSTREAM_HEDGE_MAX_DELAY_SECS = 2  # Longest wait before a hedged request is sent to the remote MCP server
+UPSTREAM_MAX_ATTEMPTS = 3  # Attempts of an idempotent request to the remote MCP server failing transiently
+UPSTREAM_RETRY_BUDGET_RATIO = 0.1  # Hedged and retried requests allowed per request to the remote MCP server
+RATE_LIMIT_SESSION_REQUESTS_PER_SEC = 20  # Sustained rate of requests to /mcp allowed per MCP session
+RATE_LIMIT_SESSION_BURST = 40  # Requests to /mcp an MCP session can send at once after being idle
+RATE_LIMIT_TOKEN_REQUESTS_PER_SEC = 50  # Sustained rate of requests to /mcp allowed per bearer token
+RATE_LIMIT_TOKEN_BURST = 100  # Requests to /mcp a bearer token can send at once after being idle
 
 
 class ChargeEvents(StrEnum):
@@ -34,3 +60,41 @@ TOOL_WHITELIST = {
     ChargeEvents.DOWNLOAD_PAPER.value: (ChargeEvents.DOWNLOAD_PAPER.value, 1),
     ChargeEvents.READ_PAPER.value: (ChargeEvents.READ_PAPER.value, 1),
 }
+
+# Deadlines of tool calls
+# Calls of tools listed here that run longer are stopped: the MCP server is told to cancel the request,
+# and the client gets an error result. Calls are also stopped when the client session is closed.
+# Format of the dictionary: {tool_name: timeout_secs}
+TOOL_TIMEOUTS = {
+    ChargeEvents.SEARCH_PAPERS.value: 60,
+    ChargeEvents.LIST_PAPERS.value: 60,
+    ChargeEvents.DOWNLOAD_PAPER.value: 300,
+    ChargeEvents.READ_PAPER.value: 120,
+}
+
+# Concurrency limits of expensive tools
+# Tools listed here are forwarded to the MCP server at most this many times concurrently; further calls wait
+# for a free slot and are rejected with an error result if none frees up within TOOL_CALL_QUEUE_TIMEOUT_SECS.
+# All tool calls together are additionally limited by TOOL_MAX_CONCURRENT_CALLS.
+# Format of the dictionary: {tool_name: max_concurrent_calls}
+TOOL_CONCURRENCY_LIMITS = {
+    ChargeEvents.DOWNLOAD_PAPER.value: 4,
+    ChargeEvents.READ_PAPER.value: 8,
+}
+
+# Result cache for idempotent (read-only) tools
+# Results of tools listed here are cached, so repeated calls with the same arguments are not forwarded
+# to the MCP server. Only add tools whose result depends solely on their arguments.
+# Format of the dictionary: {tool_name: (ttl_secs, charge_on_hit)}
+# If charge_on_hit is True, calls served from the cache are charged the same as calls forwarded to the server.
+# No tool is cached by default, as clients would get results up to ttl_secs old; uncomment entries to opt in.
+TOOL_RESULT_CACHE: dict[str, tuple[float, bool]] = {
+    # ChargeEvents.SEARCH_PAPERS.value: (60 * 10, True),
+    # ChargeEvents.READ_PAPER.value: (60 * 60, True),
+}
+
+# Tools whose calls are hedged and retried with a remote (SSE or HTTP) MCP server (see HedgePolicy)
+# A call of a tool listed here may reach the MCP server more than once, so only list tools that are safe
+# to call repeatedly with the same arguments. Calls of other tools are sent once.
+HEDGED_TOOLS: set[str] = set()
+# HEDGED_TOOLS = {ChargeEvents.SEARCH_PAPERS.value, ChargeEvents.READ_PAPER.value}  # noqa: ERA001
@@ -1,14 +1,23 @@
-# Source https://github.com/modelcontextprotocol/python-sdk/blob/3978c6e1b91e8830e82d97ab3c4e3b6559972021/examples/servers/simple-streamablehttp/mcp_simple_streamablehttp/event_store.py
-"""In-memory event store for demonstrating resumability functionality.
+# Based on https://github.com/modelcontextprotocol/python-sdk/blob/3978c6e1b91e8830e82d97ab3c4e3b6559972021/examples/servers/simple-streamablehttp/mcp_simple_streamablehttp/event_store.py
+"""In-memory event store for resumability of Streamable HTTP connections.
 
-This is a simple implementation intended for examples and testing,
-not for production use where a persistent storage solution would be more appropriate.
+Event IDs encode the stream key and a sequence number, so a replay jumps straight to the resume point
+instead of searching for it. Each stream keeps its last N events in a ring buffer, and the whole store
+is bounded by a byte budget: when it is exceeded, the least recently used streams are evicted first.
+
+Stream IDs of the MCP transport are request IDs, which repeat across sessions, so streams are keyed by
+the session they belong to as well (see `current_session_key`). This lets the store drop all streams of
+a session once the session ends.
+
+Messages are stored as the JSON frames sent to the client, so a stored event costs little more than
+its serialized bytes, and a replay sends the frames as they are without validating them again.
 """
 
 import logging
-from collections import deque
-from dataclasses import dataclass
-from uuid import uuid4
+import time
+from abc import abstractmethod
+from collections import OrderedDict
+from contextvars import ContextVar
 
 from mcp.server.streamable_http import (
     EventCallback,
@@ -17,59 +26,200 @@ from mcp.server.streamable_http import (
     EventStore,
     StreamId,
 )
-from mcp.types import JSONRPCMessage
+from mcp.types import JSONRPCError, JSONRPCMessage, JSONRPCNotification, JSONRPCRequest, JSONRPCResponse
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_EVENTS_PER_STREAM = 100
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64 MiB
+DEFAULT_STREAM_TTL_SECS = 30 * 60  # Streams unused for this long are reclaimed by compaction
+EVENT_ID_SEPARATOR = ':'
+SESSION_KEY_SEPARATOR = '/'
+
+# Key of the MCP session the current request belongs to. Set by the proxy for every request;
+# the session's server task inherits the value set during the initialization request.
+current_session_key: ContextVar[str] = ContextVar('current_session_key', default='')
+
+
+def make_stream_key(stream_id: StreamId, session_key: str) -> str:
+    """Create the key of a stream, which is unique across sessions."""
+    return f'{session_key}{SESSION_KEY_SEPARATOR}{stream_id}'
+
+
+def split_stream_key(stream_key: str) -> tuple[StreamId, str]:
+    """Split a stream key into the stream ID and the session key."""
+    session_key, _, stream_id = stream_key.partition(SESSION_KEY_SEPARATOR)
+    return stream_id, session_key
+
+
+def make_event_id(stream_key: str, sequence: int) -> EventId:
+    """Create an event ID encoding the stream key and the sequence number of the event."""
+    return f'{stream_key}{EVENT_ID_SEPARATOR}{sequence}'
+
+
+def parse_event_id(event_id: EventId) -> tuple[str, int] | None:
+    """Split an event ID into the stream key and sequence number, or return None if it is malformed."""
+    stream_key, separator, sequence = event_id.rpartition(EVENT_ID_SEPARATOR)
+    if not separator or not sequence.isdigit():
+        return None
+    return stream_key, int(sequence)
+
+
+class SessionEventStore(EventStore):
+    """Event store that can release the streams of ended sessions."""
+
+    @abstractmethod
+    def discard_session(self, session_key: str) -> None:
+        """Release all streams of the session with the given key."""
+
+    @abstractmethod
+    def compact(self) -> int:
+        """Reclaim storage of streams that can no longer be resumed and return the number of reclaimed items."""
+
+
+class SerializedMessage:
+    """A JSON-RPC message serialized to the JSON frame sent to the client.
+
+    Stands in for `JSONRPCMessage` in replayed `EventMessage`s: the transport only serializes replayed
+    messages, so the stored frame is returned as it is instead of being validated into a model first.
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    @classmethod
+    def from_message(cls, message: JSONRPCMessage) -> 'SerializedMessage':
+        """Serialize a message the same way the transport does."""
+        return cls(message.model_dump_json(by_alias=True, exclude_none=True).encode())
 
-@dataclass
-class EventEntry:
-    """Represents an event entry in the event store."""
+    @property
+    def root(self) -> JSONRPCRequest | JSONRPCNotification | JSONRPCResponse | JSONRPCError:
+        """The validated message, for consumers that inspect it (not needed to replay it)."""
+        return JSONRPCMessage.model_validate_json(self.data).root
 
-    event_id: EventId
-    stream_id: StreamId
-    message: JSONRPCMessage | None
+    def model_dump_json(self, **_kwargs: object) -> str:
+        """Return the serialized message (it was serialized with the options the transport uses)."""
+        return self.data.decode()
 
+    def to_event(self, event_id: EventId) -> EventMessage:
+        """Wrap the message in an event to be replayed."""
+        return EventMessage(self, event_id)  # ty: ignore[invalid-argument-type]
 
-class InMemoryEventStore(EventStore):
-    """Simple in-memory implementation of the EventStore interface for resumability.
-    This is primarily intended for examples and testing, not for production use
-    where a persistent storage solution would be more appropriate.
 
-    This implementation keeps only the last N events per stream for memory efficiency.
-    """  # noqa: D205
+class StreamBuffer:
+    """Ring buffer holding the last events of a single stream.
 
-    def __init__(self, max_events_per_stream: int = 100):  # noqa: ANN204
+    Sequence numbers are contiguous within a stream, so the event with sequence number `seq`
+    lives in slot `seq % capacity` as long as `first_seq <= seq < next_seq`. Events are kept as
+    serialized messages only, their IDs are derived from the stream key and sequence number.
+    Events without a message (such as the priming events of a stream) are kept as empty frames.
+    """
+
+    __slots__ = ('capacity', 'events', 'first_seq', 'last_used', 'next_seq', 'session_key', 'size_bytes', 'stream_id')
+
+    def __init__(self, stream_id: StreamId, session_key: str, capacity: int, first_seq: int) -> None:
+        self.stream_id = stream_id
+        self.session_key = session_key
+        self.capacity = capacity
+        self.events: list[bytes | None] = [None] * capacity
+        self.first_seq = first_seq
+        self.next_seq = first_seq
+        self.size_bytes = 0
+        self.last_used = time.monotonic()
+
+    def __len__(self) -> int:
+        """Return the number of events currently held by the buffer."""
+        return self.next_seq - self.first_seq
+
+    def append(self, data: bytes) -> bytes | None:
+        """Append a serialized event and return the event it displaced, if the buffer was full."""
+        displaced = None
+        if len(self) == self.capacity:
+            displaced = self.pop_oldest()
+        self.events[self.next_seq % self.capacity] = data
+        self.next_seq += 1
+        self.size_bytes += len(data)
+        return displaced
+
+    def pop_oldest(self) -> bytes | None:
+        """Remove and return the oldest serialized event of the stream."""
+        if not len(self):
+            return None
+        slot = self.first_seq % self.capacity
+        data = self.events[slot]
+        self.events[slot] = None
+        self.first_seq += 1
+        if data is not None:
+            self.size_bytes -= len(data)
+        return data
+
+    def events_after(self, sequence: int) -> list[tuple[int, bytes]] | None:
+        """Return (sequence, data) of the events with a message following `sequence`.
+
+        Returns None if `sequence` is no longer in the buffer.
+        """
+        if not self.first_seq <= sequence < self.next_seq:
+            return None
+        return [(seq, data) for seq in range(sequence + 1, self.next_seq) if (data := self.events[seq % self.capacity])]
+
+
+class InMemoryEventStore(SessionEventStore):
+    """In-memory implementation of the EventStore interface for resumability.
+
+    This implementation keeps only the last N events per stream and at most `max_bytes` of events
+    in total, evicting the least recently used streams when the budget is exceeded.
+    Events are lost when the process restarts.
+    """
+
+    def __init__(
+        self,
+        max_events_per_stream: int = DEFAULT_MAX_EVENTS_PER_STREAM,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        stream_ttl_secs: float = DEFAULT_STREAM_TTL_SECS,
+    ) -> None:
         """Initialize the event store.
 
         Args:
             max_events_per_stream: Maximum number of events to keep per stream
+            max_bytes: Maximum total size of stored event payloads, in bytes
+            stream_ttl_secs: Time after which an unused stream is reclaimed by `compact`
         """
         self.max_events_per_stream = max_events_per_stream
-        # for maintaining last N events per stream
-        self.streams: dict[StreamId, deque[EventEntry]] = {}
-        # event_id -> EventEntry for quick lookup
-        self.event_index: dict[EventId, EventEntry] = {}
+        self.max_bytes = max_bytes
+        self.stream_ttl_secs = stream_ttl_secs
+        # Streams by stream key in least recently used order (the most recently used stream is last)
+        self.streams: OrderedDict[str, StreamBuffer] = OrderedDict()
+        # session key -> keys of the session's streams
+        self.sessions: dict[str, set[str]] = {}
+        self.size_bytes = 0
+        self.evicted_streams = 0
+        # Sequence numbers are never reused, even across streams, so that event IDs issued for an
+        # evicted stream cannot match events of a new stream with the same key
+        self._next_seq = 0
 
     async def store_event(self, stream_id: StreamId, message: JSONRPCMessage | None) -> EventId:
-        """Stores an event with a generated event ID."""  # noqa: D401
-        event_id = str(uuid4())
-        event_entry = EventEntry(event_id=event_id, stream_id=stream_id, message=message)
-
-        # Get or create deque for this stream
-        if stream_id not in self.streams:
-            self.streams[stream_id] = deque(maxlen=self.max_events_per_stream)
+        """Store an event and return its ID."""
+        session_key = current_session_key.get()
+        stream_key = make_stream_key(stream_id, session_key)
+        stream = self.streams.get(stream_key)
+        if stream is None:
+            stream = StreamBuffer(stream_id, session_key, self.max_events_per_stream, self._next_seq)
+            self.streams[stream_key] = stream
+            self.sessions.setdefault(session_key, set()).add(stream_key)
+        else:
+            self.streams.move_to_end(stream_key)
+            stream.last_used = time.monotonic()
 
-        # If deque is full, the oldest event will be automatically removed
-        # We need to remove it from the event_index as well
-        if len(self.streams[stream_id]) == self.max_events_per_stream:
-            oldest_event = self.streams[stream_id][0]
-            self.event_index.pop(oldest_event.event_id, None)
-
-        # Add new event
-        self.streams[stream_id].append(event_entry)
-        self.event_index[event_id] = event_entry
+        event_id = make_event_id(stream_key, stream.next_seq)
+        data = SerializedMessage.from_message(message).data if message else b''
+        if displaced := stream.append(data):
+            self.size_bytes -= len(displaced)
+        self.size_bytes += len(data)
+        self._next_seq = max(self._next_seq, stream.next_seq)
 
+        self._enforce_budget(stream)
         return event_id
 
     async def replay_events_after(
@@ -77,22 +227,59 @@ class InMemoryEventStore(EventStore):
         last_event_id: EventId,
         send_callback: EventCallback,
     ) -> StreamId | None:
-        """Replays events that occurred after the specified event ID."""
-        if last_event_id not in self.event_index:
+        """Replay events that occurred after the specified event ID."""
+        stream = events = None
+        if parsed := parse_event_id(last_event_id):
+            stream_key, sequence = parsed
+            if (stream := self.streams.get(stream_key)) is not None:
+                events = stream.events_after(sequence)
+        if not parsed or stream is None or events is None:
             logger.warning(f'Event ID {last_event_id} not found in store')
             return None
 
-        # Get the stream and find events after the last one
-        last_event = self.event_index[last_event_id]
-        stream_id = last_event.stream_id
-        stream_events = self.streams.get(last_event.stream_id, deque())
+        self.streams.move_to_end(stream_key)
+        stream.last_used = time.monotonic()
+        for sequence, data in events:
+            await send_callback(SerializedMessage(data).to_event(make_event_id(stream_key, sequence)))
+
+        return stream.stream_id
+
+    def discard_session(self, session_key: str) -> None:
+        """Release all streams of the session with the given key."""
+        for stream_key in list(self.sessions.get(session_key, ())):
+            self._remove_stream(stream_key)
+
+    def compact(self) -> int:
+        """Reclaim streams that were not used for `stream_ttl_secs` and return how many were reclaimed."""
+        cutoff = time.monotonic() - self.stream_ttl_secs
+        reclaimed = 0
+        # Streams are ordered by last use, so the expired ones are at the front
+        while self.streams:
+            stream_key, stream = next(iter(self.streams.items()))
+            if stream.last_used >= cutoff:
+                break
+            self._remove_stream(stream_key)
+            reclaimed += 1
+        return reclaimed
+
+    def _remove_stream(self, stream_key: str) -> None:
+        stream = self.streams.pop(stream_key)
+        self.size_bytes -= stream.size_bytes
+        if (session_streams := self.sessions.get(stream.session_key)) is not None:
+            session_streams.discard(stream_key)
+            if not session_streams:
+                del self.sessions[stream.session_key]
 
-        # Events in deque are already in chronological order
-        found_last = False
-        for event in stream_events:
-            if found_last and event.message is not None:
-                await send_callback(EventMessage(event.message, event.event_id))
-            elif event.event_id == last_event_id:
-                found_last = True
+    def _enforce_budget(self, current: StreamBuffer) -> None:
+        """Evict least recently used streams (and then the oldest events of `current`) until within budget."""
+        while self.size_bytes > self.max_bytes and len(self.streams) > 1:
+            stream_key, stream = next(iter(self.streams.items()))
+            if stream is current:
+                break
+            self._remove_stream(stream_key)
+            self.evicted_streams += 1
+            logger.debug(f'Evicted event stream {stream_key} from the event store')
 
-        return stream_id
+        while self.size_bytes > self.max_bytes and len(current) > 1:
+            if oldest := current.pop_oldest():
+                self.size_bytes -= len(oldest)
@@ -0,0 +1,293 @@
+"""On-disk event store for resumability of Streamable HTTP connections, keeping events out of memory.
+
+Events of all streams are appended to a segmented log on disk. Each record carries its sequence number,
+stream key, serialized message and a CRC32 checksum, which is verified when the record is read.
+Concurrent writes are batched into a single write handed to the OS, without fsync, as the log does not
+need to survive a crash. Replays read the segments through mmap, starting at the offset found in a sparse
+in-memory index.
+
+Sessions exist only in the memory of the server, so a stream can only be resumed while the run that
+wrote it is alive; segments left in the directory by an earlier run are deleted when the store is opened.
+Only files named like segments of the store (`SEGMENT_PREFIX`) are deleted, so the directory can be shared.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import mmap
+import struct
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO
+
+from .event_store import (
+    SerializedMessage,
+    SessionEventStore,
+    current_session_key,
+    make_event_id,
+    make_stream_key,
+    parse_event_id,
+    split_stream_key,
+)
+
+if TYPE_CHECKING:
+    import os
+    from collections.abc import Iterator
+
+    from mcp.server.streamable_http import EventCallback, EventId, StreamId
+    from mcp.types import JSONRPCMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_BYTES = 8 * 1024 * 1024  # 8 MiB
+DEFAULT_MAX_SEGMENTS = 16
+DEFAULT_INDEX_INTERVAL = 64  # Records between two entries of the sparse index
+
+# Segment files are named `<SEGMENT_PREFIX><base sequence number><SEGMENT_SUFFIX>`; other files in the
+# directory are never touched
+SEGMENT_PREFIX = 'mcp-events-'
+SEGMENT_SUFFIX = '.log'
+_CRC = struct.Struct('<I')
+_HEADER = struct.Struct('<IQH')  # payload length, sequence number, stream key length
+_NO_PAYLOAD = 0xFFFFFFFF  # Payload length of priming events, which have no message
+
+
+def _encode_record(sequence: int, stream_key: str, payload: bytes | None) -> bytes:
+    stream_key_bytes = stream_key.encode()
+    payload_length = _NO_PAYLOAD if payload is None else len(payload)
+    body = _HEADER.pack(payload_length, sequence, len(stream_key_bytes)) + stream_key_bytes + (payload or b'')
+    return _CRC.pack(zlib.crc32(body)) + body
+
+
+def _iter_records(buffer: bytes | mmap.mmap, start: int, end: int) -> Iterator[tuple[int, int, str, bytes | None]]:
+    """Yield (end offset, sequence number, stream key, payload) of valid records in `buffer[start:end]`."""
+    offset = start
+    while offset + _CRC.size + _HEADER.size <= end:
+        body_start = offset + _CRC.size
+        payload_length, sequence, stream_key_length = _HEADER.unpack_from(buffer, body_start)
+        payload_start = body_start + _HEADER.size + stream_key_length
+        record_end = payload_start + (0 if payload_length == _NO_PAYLOAD else payload_length)
+        if record_end > end or zlib.crc32(buffer[body_start:record_end]) != _CRC.unpack_from(buffer, offset)[0]:
+            return
+        stream_key = bytes(buffer[body_start + _HEADER.size : payload_start]).decode()
+        payload = None if payload_length == _NO_PAYLOAD else bytes(buffer[payload_start:record_end])
+        yield record_end, sequence, stream_key, payload
+        offset = record_end
+
+
+@dataclass
+class LogSegment:
+    """A single file of the event log together with its sparse offset index."""
+
+    path: Path
+    base_seq: int
+    size: int = 0
+    last_seq: int = -1
+    records: int = 0
+    index_seqs: list[int] = field(default_factory=list)
+    index_offsets: list[int] = field(default_factory=list)
+    session_keys: set[str] = field(default_factory=set)
+
+    def offset_for(self, sequence: int) -> int:
+        """Return the offset of the last indexed record at or before `sequence`."""
+        position = bisect.bisect_right(self.index_seqs, sequence) - 1
+        return self.index_offsets[position] if position >= 0 else 0
+
+    def read_records(self, start: int = 0) -> Iterator[tuple[int, int, str, bytes | None]]:
+        """Read records of the segment through mmap, starting at `start`."""
+        if self.size <= start:
+            return
+        with self.path.open('rb') as file, mmap.mmap(file.fileno(), self.size, access=mmap.ACCESS_READ) as buffer:
+            yield from _iter_records(buffer, start, self.size)
+
+
+class FileEventStore(SessionEventStore):
+    """Append-only on-disk implementation of the EventStore interface for resumability.
+
+    Holds the events on disk instead of in memory, which suits servers streaming large results. Streams
+    do not survive Actor restarts or migrations: the sessions they belong to are gone, and the log of an
+    earlier run is deleted when the store is opened. The log is bounded by `max_segments` segments of
+    about `segment_bytes` each; the oldest segment is deleted when a new one is started. Segments holding
+    only streams of ended sessions are deleted earlier by `compact`.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str],
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        max_segments: int = DEFAULT_MAX_SEGMENTS,
+        index_interval: int = DEFAULT_INDEX_INTERVAL,
+    ) -> None:
+        """Initialize the event store.
+
+        Args:
+            directory: Directory holding the log segments; created if it does not exist
+            segment_bytes: Size in bytes after which a new segment is started
+            max_segments: Maximum number of segments kept on disk
+            index_interval: Number of records between two entries of the sparse offset index
+        """
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.index_interval = index_interval
+        self.segments: list[LogSegment] = []
+        self.discarded_sessions: set[str] = set()
+        self._next_seq = 0
+        self._file: BinaryIO | None = None
+        self._pending: list[tuple[int, str, bytes, asyncio.Future[None]]] = []
+        self._writer: asyncio.Task | None = None
+
+    @property
+    def size_bytes(self) -> int:
+        """Total size of the log segments on disk."""
+        return sum(segment.size for segment in self.segments)
+
+    async def store_event(self, stream_id: StreamId, message: JSONRPCMessage | None) -> EventId:
+        """Append an event to the log and return its ID once it has been handed to the OS."""
+        self._open()
+        sequence = self._next_seq
+        self._next_seq += 1
+        payload = SerializedMessage.from_message(message).data if message else None
+        stream_key = make_stream_key(stream_id, current_session_key.get())
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((sequence, stream_key, _encode_record(sequence, stream_key, payload), future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+        await future
+        return make_event_id(stream_key, sequence)
+
+    async def replay_events_after(
+        self,
+        last_event_id: EventId,
+        send_callback: EventCallback,
+    ) -> StreamId | None:
+        """Replay events of the stream that occurred after the specified event ID."""
+        self._open()
+        events = None
+        if parsed := parse_event_id(last_event_id):
+            stream_key, sequence = parsed
+            if split_stream_key(stream_key)[1] not in self.discarded_sessions:
+                events = await asyncio.to_thread(self._collect_events_after, stream_key, sequence, list(self.segments))
+        if not parsed or events is None:
+            logger.warning(f'Event ID {last_event_id} not found in store')
+            return None
+
+        # Payloads are the frames sent to the client, so they are replayed without validating them again
+        for sequence, payload in events:
+            await send_callback(SerializedMessage(payload).to_event(make_event_id(stream_key, sequence)))
+
+        return split_stream_key(stream_key)[0]
+
+    def discard_session(self, session_key: str) -> None:
+        """Mark the streams of the session as ended; their segments are deleted by `compact`."""
+        self.discarded_sessions.add(session_key)
+
+    def compact(self) -> int:
+        """Delete segments holding only streams of ended sessions and return how many were deleted."""
+        deleted = 0
+        # The active segment is never deleted
+        for segment in self.segments[:-1]:
+            if segment.session_keys <= self.discarded_sessions:
+                self.segments.remove(segment)
+                segment.path.unlink(missing_ok=True)
+                deleted += 1
+        # Forget ended sessions that no longer have any events on disk
+        self.discarded_sessions &= set().union(*(segment.session_keys for segment in self.segments))
+        return deleted
+
+    async def aclose(self) -> None:
+        """Wait for pending writes and close the active segment."""
+        if self._writer is not None:
+            await self._writer
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def _collect_events_after(
+        stream_key: str, sequence: int, segments: list[LogSegment]
+    ) -> list[tuple[int, bytes]] | None:
+        """Return (sequence, payload) of the stream's events after `sequence`, or None if it is not in the log."""
+        position = bisect.bisect_right([segment.base_seq for segment in segments], sequence) - 1
+        if position < 0 or sequence > segments[position].last_seq:
+            return None
+
+        events: list[tuple[int, bytes]] = []
+        found = False
+        for segment in segments[position:]:
+            start = segment.offset_for(sequence) if segment is segments[position] else 0
+            for _, record_seq, record_stream_key, payload in segment.read_records(start):
+                if record_seq < sequence or record_stream_key != stream_key:
+                    continue
+                if record_seq == sequence:
+                    found = True
+                elif payload is not None:
+                    events.append((record_seq, payload))
+            if not found:
+                return None
+        return events
+
+    def _open(self) -> None:
+        """Open the log, deleting segments left by a previous run, if not done yet."""
+        if self._file is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Their sessions ended with the previous run, so the streams can no longer be resumed
+        if stale := sorted(self.directory.glob(f'{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}')):
+            for path in stale:
+                path.unlink(missing_ok=True)
+            logger.info(f'Deleted {len(stale)} event log segments of a previous run from {self.directory}')
+        self._start_segment()
+
+    def _start_segment(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        path = self.directory / f'{SEGMENT_PREFIX}{self._next_seq:020d}{SEGMENT_SUFFIX}'
+        self.segments.append(LogSegment(path=path, base_seq=self._next_seq))
+        self._file = path.open('ab')
+
+        while len(self.segments) > self.max_segments:
+            oldest = self.segments.pop(0)
+            oldest.path.unlink(missing_ok=True)
+
+    def _index_record(self, segment: LogSegment, sequence: int, stream_key: str, offset: int) -> None:
+        if segment.records % self.index_interval == 0:
+            segment.index_seqs.append(sequence)
+            segment.index_offsets.append(offset)
+        segment.records += 1
+        segment.last_seq = sequence
+        segment.session_keys.add(split_stream_key(stream_key)[1])
+
+    @staticmethod
+    def _write(file: BinaryIO, data: bytes) -> None:
+        file.write(data)
+        file.flush()
+
+    async def _write_pending(self) -> None:
+        """Write queued records in batches; records queued during a write form the next batch."""
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                if self.segments[-1].size >= self.segment_bytes:
+                    self._start_segment()
+                segment = self.segments[-1]
+                data = b''.join(record for _, _, record, _ in batch)
+                await asyncio.to_thread(self._write, self._file, data)  # ty: ignore[invalid-argument-type]
+            except Exception as e:
+                logger.exception('Failed to write events to the event log')
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = segment.size
+            for sequence, stream_key, record, future in batch:
+                self._index_record(segment, sequence, stream_key, offset)
+                offset += len(record)
+                if not future.done():
+                    future.set_result(None)
+            segment.size = offset
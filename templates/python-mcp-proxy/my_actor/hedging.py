@@ -0,0 +1,213 @@
+"""Hedged and retried requests to a remote (Streamable HTTP or SSE) MCP server.
+
+A slow response of the remote server translates directly into the latency seen by clients. For idempotent
+operations (list requests, reads and tools declared read-only), the proxy sends a second, hedged request
+when the first one takes longer than a high percentile of the recent latencies of the operation, and uses
+whichever response arrives first. Requests failing with a transient error are retried with exponential
+backoff. Both hedges and retries draw from a budget refilled by a fraction of the requests, so that they
+cannot multiply the load of an upstream server that is slow for everyone.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, TypeVar
+
+import httpx
+from mcp.shared.exceptions import McpError
+
+from .const import (
+    UPSTREAM_HEDGE_MAX_DELAY_SECS,
+    UPSTREAM_HEDGE_PERCENTILE,
+    UPSTREAM_MAX_ATTEMPTS,
+    UPSTREAM_RETRY_BUDGET_RATIO,
+)
+from .upstream_pool import is_connection_error
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from mcp import types
+    from mcp.client.session import ClientSession
+    from pydantic import AnyUrl
+
+logger = logging.getLogger('apify')
+
+T = TypeVar('T')
+
+LATENCY_WINDOW = 200  # Number of recent latencies per operation used to compute the hedge delay
+MIN_LATENCY_SAMPLES = 20  # Until an operation has this many samples, `max_hedge_delay_secs` is used
+
+
+@dataclass
+class HedgePolicy:
+    """Configuration of hedged and retried requests.
+
+    Attributes:
+        hedge_percentile: Percentile (0-100) of recent latencies of an operation after which a hedged request
+            is sent
+        min_hedge_delay_secs: Lower bound of the hedge delay
+        max_hedge_delay_secs: Upper bound of the hedge delay, also used until enough latencies are known
+        max_attempts: Maximum number of attempts of a request failing with a transient error
+        retry_backoff_secs: Delay before the first retry; doubled with every further retry
+        budget_ratio: Hedges and retries allowed per request, on average
+        max_budget: Maximum number of hedges and retries that can be saved up for a burst
+    """
+
+    hedge_percentile: float = UPSTREAM_HEDGE_PERCENTILE
+    min_hedge_delay_secs: float = 0.05
+    max_hedge_delay_secs: float = UPSTREAM_HEDGE_MAX_DELAY_SECS
+    max_attempts: int = UPSTREAM_MAX_ATTEMPTS
+    retry_backoff_secs: float = 0.1
+    budget_ratio: float = UPSTREAM_RETRY_BUDGET_RATIO
+    max_budget: float = 10
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Return whether the request failed with a transient error and may be sent again."""
+    if isinstance(error, McpError) and error.error.code == httpx.codes.REQUEST_TIMEOUT:
+        return True
+    return isinstance(error, TimeoutError | httpx.TransportError) or is_connection_error(error)
+
+
+class HedgedSession:
+    """Wrapper of a `ClientSession` sending hedged and retried requests for idempotent operations.
+
+    Requests of other operations, and calls of tools not listed in `idempotent_tools`, are sent once,
+    directly through the wrapped session.
+
+    Attributes:
+        hedges: Number of hedged requests sent
+        hedge_wins: Number of hedged requests that returned before the original request
+        retries: Number of retried requests
+    """
+
+    def __init__(
+        self,
+        session: ClientSession,
+        policy: HedgePolicy,
+        idempotent_tools: set[str] | frozenset[str] = frozenset(),
+    ) -> None:
+        """Initialize the wrapper.
+
+        Args:
+            session: Client session of the remote MCP server
+            policy: Configuration of hedged and retried requests
+            idempotent_tools: Names of tools that are safe to call more than once with the same arguments
+        """
+        self.session = session
+        self.policy = policy
+        self.idempotent_tools = idempotent_tools
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self._budget = policy.max_budget
+        # operation -> latencies of its recent successful requests
+        self._latencies: defaultdict[str, deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def __getattr__(self, name: str) -> Any:
+        """Delegate operations that are not hedged to the wrapped session."""
+        return getattr(self.session, name)
+
+    async def list_tools(self, *args: Any, **kwargs: Any) -> types.ListToolsResult:
+        """Send a hedged tools/list request."""
+        return await self.call('tools/list', lambda: self.session.list_tools(*args, **kwargs))
+
+    async def list_prompts(self, *args: Any, **kwargs: Any) -> types.ListPromptsResult:
+        """Send a hedged prompts/list request."""
+        return await self.call('prompts/list', lambda: self.session.list_prompts(*args, **kwargs))
+
+    async def get_prompt(self, *args: Any, **kwargs: Any) -> types.GetPromptResult:
+        """Send a hedged prompts/get request."""
+        return await self.call('prompts/get', lambda: self.session.get_prompt(*args, **kwargs))
+
+    async def list_resources(self, *args: Any, **kwargs: Any) -> types.ListResourcesResult:
+        """Send a hedged resources/list request."""
+        return await self.call('resources/list', lambda: self.session.list_resources(*args, **kwargs))
+
+    async def list_resource_templates(self, *args: Any, **kwargs: Any) -> types.ListResourceTemplatesResult:
+        """Send a hedged resources/templates/list request."""
+        return await self.call(
+            'resources/templates/list', lambda: self.session.list_resource_templates(*args, **kwargs)
+        )
+
+    async def read_resource(self, uri: AnyUrl) -> types.ReadResourceResult:
+        """Send a hedged resources/read request."""
+        return await self.call('resources/read', lambda: self.session.read_resource(uri))
+
+    async def call_tool(self, name: str, *args: Any, **kwargs: Any) -> types.CallToolResult:
+        """Send a tools/call request, hedged if the tool is idempotent."""
+        if name not in self.idempotent_tools:
+            return await self.session.call_tool(name, *args, **kwargs)
+        return await self.call(f'tools/call:{name}', lambda: self.session.call_tool(name, *args, **kwargs))
+
+    async def call(self, operation: str, send: Callable[[], Awaitable[T]]) -> T:
+        """Send a request of an idempotent operation with hedging and retries."""
+        self._budget = min(self._budget + self.policy.budget_ratio, self.policy.max_budget)
+        attempt = 1
+        while True:
+            try:
+                return await self._send_hedged(operation, send)
+            except Exception as e:
+                if attempt >= self.policy.max_attempts or not is_retryable(e) or not self._withdraw_budget():
+                    raise
+                # Full jitter keeps retries of concurrent requests from arriving at the same time
+                delay = random.uniform(0, self.policy.retry_backoff_secs * 2 ** (attempt - 1))  # noqa: S311
+                logger.warning(f'Request {operation} to the remote MCP server failed ({e!r}), retrying in {delay:.2f}s')
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def _withdraw_budget(self) -> bool:
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        return True
+
+    def _hedge_delay(self, operation: str) -> float:
+        latencies = self._latencies[operation]
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return self.policy.max_hedge_delay_secs
+        ordered = sorted(latencies)
+        percentile = ordered[min(int(len(ordered) * self.policy.hedge_percentile / 100), len(ordered) - 1)]
+        return min(max(percentile, self.policy.min_hedge_delay_secs), self.policy.max_hedge_delay_secs)
+
+    async def _send_hedged(self, operation: str, send: Callable[[], Awaitable[T]]) -> T:
+        """Send the request and, if it is slower than the hedge delay, a second one; return the first result."""
+        started_at: dict[asyncio.Future[T], float] = {}
+
+        def _start() -> asyncio.Future[T]:
+            future = asyncio.ensure_future(send())
+            started_at[future] = time.monotonic()
+            return future
+
+        primary = _start()
+        pending = {primary}
+        hedge_timeout: float | None = self._hedge_delay(operation)
+        error: BaseException | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=hedge_timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The request is slower than usual, send a hedged one (at most one per attempt)
+                    hedge_timeout = None
+                    if self._withdraw_budget():
+                        self.hedges += 1
+                        pending.add(_start())
+                    continue
+                for future in done:
+                    if (error := future.exception()) is None:
+                        self._latencies[operation].append(time.monotonic() - started_at[future])
+                        if future is not primary:
+                            self.hedge_wins += 1
+                        return future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+        assert error is not None  # noqa: S101
+        raise error
@@ -2,10 +2,24 @@
 
 import os
 
-from apify import Actor
-
-from .const import SESSION_TIMEOUT_SECS, TOOL_WHITELIST
-from .models import ServerType
+from apify import Actor, Event
+
+from .const import (
+    HEDGED_TOOLS,
+    LIST_PAGE_SIZE,
+    PROGRESS_MAX_NOTIFICATIONS_PER_SEC,
+    SESSION_TIMEOUT_SECS,
+    TOOL_CONCURRENCY_LIMITS,
+    TOOL_MAX_CONCURRENT_CALLS,
+    TOOL_RESULT_CACHE,
+    TOOL_TIMEOUTS,
+    TOOL_WHITELIST,
+    UPSTREAM_POOL_SIZE,
+)
+from .file_event_store import FileEventStore
+from .hedging import HedgePolicy
+from .models import ServerType, UpstreamServer
+from .rate_limit import RequestRateLimiter
 from .server import ProxyServer
 
 # Actor configuration
@@ -36,9 +50,42 @@ MCP_SERVER_PARAMS = StdioServerParameters(
 #     url='https://your-mcp-server',  # noqa: ERA001
 #     headers={'Authorization':  'Bearer YOUR-API-KEY'},  # Optional headers, e.g., for authentication  # noqa: ERA001
 # )  # noqa: ERA001, RUF100
+
+# 3) If you want to serve several MCP servers behind one /mcp endpoint, list them all here (this replaces the
+# server above). Their tools and prompts are served as `<name>__<tool>`, so use these names in TOOL_WHITELIST too.
+UPSTREAM_SERVERS: list[UpstreamServer] = []
+# UPSTREAM_SERVERS = [  # noqa: ERA001
+#     UpstreamServer(name='arxiv', server_type=ServerType.STDIO, config=MCP_SERVER_PARAMS),  # noqa: ERA001
+#     UpstreamServer(
+#         name='docs', server_type=ServerType.HTTP, config=RemoteServerParameters(url='https://your-mcp-server')
+#     ),
+# ]  # noqa: ERA001
 # ------------------------------------------------------------------------------
 
 session_timeout_secs = int(os.getenv('SESSION_TIMEOUT_SECS', SESSION_TIMEOUT_SECS))
+# Directory of the on-disk event store; when set, events of resumable streams are kept there instead of in memory.
+# Streams can only be resumed within the same run; log files of an earlier run are deleted when the Actor starts.
+event_store_dir = os.getenv('EVENT_STORE_DIR')
+# Number of stdio MCP server processes; with more than one, requests are load-balanced across them
+upstream_pool_size = int(os.getenv('UPSTREAM_POOL_SIZE', UPSTREAM_POOL_SIZE))
+# Maximum number of tool calls forwarded to the MCP server at the same time
+max_concurrent_tool_calls = int(os.getenv('TOOL_MAX_CONCURRENT_CALLS', TOOL_MAX_CONCURRENT_CALLS))
+# Serve /mcp without sessions, answering every request with plain JSON (for clients making independent calls)
+stateless = os.getenv('STATELESS_MODE', '').lower() in {'1', 'true'}
+# Hedge and retry idempotent requests to a remote (SSE or HTTP) MCP server to cut its tail latency (opt-in, as
+# hedged and retried requests may reach the MCP server more than once)
+hedge_requests = os.getenv('UPSTREAM_HEDGING', '').lower() in {'1', 'true'}
+# Limit requests per MCP session and per bearer token, so that a single client cannot starve the others (opt-in,
+# as the limits in const.py have to be sized for the clients of the MCP server)
+rate_limit_requests = os.getenv('RATE_LIMITING', '').lower() in {'1', 'true'}
+# Forward tool calls and resource reads to a Streamable HTTP server as raw bytes, without parsing their results
+raw_passthrough = os.getenv('RAW_PASSTHROUGH', '').lower() in {'1', 'true'}
+# Maximum number of tools, prompts or resources in a page of a list result; 0 serves the MCP server's pages whole
+list_page_size = int(os.getenv('LIST_PAGE_SIZE', LIST_PAGE_SIZE)) or None
+# Maximum rate of progress notifications forwarded per request; 0 forwards all of them
+max_progress_notifications_per_sec = (
+    float(os.getenv('PROGRESS_MAX_NOTIFICATIONS_PER_SEC', PROGRESS_MAX_NOTIFICATIONS_PER_SEC)) or None
+)
 
 
 async def main() -> None:
@@ -109,7 +156,28 @@ async def main() -> None:
                 actor_charge_function=Actor.charge,
                 tool_whitelist=TOOL_WHITELIST,
                 session_timeout_secs=session_timeout_secs,
+                event_store=FileEventStore(event_store_dir) if event_store_dir else None,
+                tool_result_cache=TOOL_RESULT_CACHE,
+                upstream_pool_size=upstream_pool_size,
+                tool_concurrency_limits=TOOL_CONCURRENCY_LIMITS,
+                max_concurrent_tool_calls=max_concurrent_tool_calls,
+                tool_timeouts=TOOL_TIMEOUTS,
+                stateless=stateless,
+                hedge_policy=HedgePolicy() if hedge_requests else None,
+                hedged_tools=HEDGED_TOOLS,
+                rate_limiter=RequestRateLimiter() if rate_limit_requests else None,
+                raw_passthrough=raw_passthrough,
+                list_page_size=list_page_size,
+                upstreams=UPSTREAM_SERVERS or None,
+                max_progress_notifications_per_sec=max_progress_notifications_per_sec,
             )
+
+            async def flush_charges(_event_data: object) -> None:
+                await proxy_server.flush_charges()
+
+            # Charges are sent in batches; make sure none are lost when the run is aborted or migrated
+            Actor.on(Event.ABORTING, flush_charges)
+            Actor.on(Event.MIGRATING, flush_charges)
             await proxy_server.start()
         except Exception as e:
             Actor.log.exception(f'Server failed to start: {e}')
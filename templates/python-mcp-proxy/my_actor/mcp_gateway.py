@@ -10,20 +10,39 @@ like tool calls, prompt operations, or resource access.
 
 from __future__ import annotations
 
+import contextlib
 import logging
-from typing import TYPE_CHECKING, Any
+import time
+from typing import TYPE_CHECKING, Any, TypeVar
 
 from mcp import server, types
 
+from .admission import ToolOverloadedError
 from .const import ChargeEvents
+from .event_store import current_session_key
+from .pagination import page_params, paginate, request_cursor
 
 if TYPE_CHECKING:
-    from collections.abc import Awaitable, Callable
+    from collections.abc import Awaitable, Callable, Hashable
 
     from mcp.client.session import ClientSession
+    from mcp.shared.session import ProgressFnT
+
+    from .admission import ToolAdmissionControl
+    from .cache import ListResultCache, ToolResultCache
+    from .cancellation import InFlightCalls
+    from .hedging import HedgedSession
+    from .metrics import ProxyMetrics
+    from .progress import ProgressSendFn, ProgressThrottle
+    from .single_flight import SingleFlight
+    from .upstream_group import UpstreamGroup
+    from .upstream_pool import UpstreamPool
+    from .validation import ToolArgumentValidator
 
 logger = logging.getLogger('apify')
 
+T = TypeVar('T')
+
 
 async def charge_mcp_operation(
     charge_function: Callable[[str, int], Awaitable[Any]] | None, event_name: str | None, count: int = 1
@@ -49,15 +68,25 @@ async def charge_mcp_operation(
         # Don't raise the exception - we want the operation to continue even if charging fails
 
 
-async def create_gateway(  # noqa: PLR0915
-    client_session: ClientSession,
+async def create_gateway(  # noqa: PLR0913, PLR0915
+    client_session: ClientSession | HedgedSession | UpstreamPool | UpstreamGroup,
     actor_charge_function: Callable[[str, int], Awaitable[Any]] | None = None,
     tool_whitelist: dict[str, tuple[str, int]] | None = None,
+    list_cache: ListResultCache | None = None,
+    tool_result_cache: ToolResultCache | None = None,
+    single_flight: SingleFlight | None = None,
+    admission_control: ToolAdmissionControl | None = None,
+    metrics: ProxyMetrics | None = None,
+    argument_validator: ToolArgumentValidator | None = None,
+    in_flight_calls: InFlightCalls | None = None,
+    list_page_size: int | None = None,
+    progress_throttle: ProgressThrottle | None = None,
 ) -> server.Server[object]:
     """Create a server instance from a remote app.
 
     Args:
-        client_session: The MCP client session to proxy requests through
+        client_session: The MCP client session (or pool of stdio server processes, or group of servers) to proxy
+                       requests through
         actor_charge_function: Optional function to charge for operations.
                        Should accept (event_name: str, count: int).
                        Typically, Actor.charge in Apify Actors.
@@ -65,7 +94,72 @@ async def create_gateway(  # noqa: PLR0915
         tool_whitelist: Optional dict mapping tool names to (event_name, default_count) tuples.
                        If provided, only whitelisted tools will be allowed and charged.
                        If None, all tools are allowed without specific charging.
+        list_cache: Optional cache of list results (tools, prompts, resources and resource templates).
+                       If None, every list request is forwarded to the remote server.
+        tool_result_cache: Optional cache of results of idempotent tool calls.
+                       If None, every tool call is forwarded to the remote server.
+        single_flight: Optional coalescing of concurrent identical list, read resource and get prompt requests
+                       into a single call to the remote server. If None, requests are not coalesced.
+        admission_control: Optional concurrency limits of tool calls forwarded to the remote server.
+                       Calls over the limits are rejected with an error result. If None, calls are not limited.
+        metrics: Optional metrics recording latencies of tool calls. If None, no metrics are recorded.
+        argument_validator: Optional validator of tool call arguments against the input schemas of the tools,
+                       updated whenever the tools are listed. If None, arguments are not validated.
+        in_flight_calls: Optional tracking of tool calls forwarded to the remote server, which stops them at
+                       their tool's deadline or when the client session is closed. If None, calls are not stopped.
+        list_page_size: Maximum number of items in a page of a list result. Larger pages of the remote server
+                       are split into several pages. If None, pages of the remote server are served whole.
+        progress_throttle: Optional rate limit of progress notifications forwarded between the client and the
+                       remote server. If None, every progress notification is forwarded.
     """
+
+    async def _coalesced(key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        if single_flight is None:
+            return await fn()
+        return await single_flight.do(key, fn)
+
+    async def _cached_list(key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        if list_cache is None:
+            return await _coalesced(key, loader)
+        return await list_cache.get_or_load(key, lambda: _coalesced(key, loader))
+
+    async def _list_page(
+        req: types.PaginatedRequest,
+        items_field: str,
+        load_page: Callable[[str | None], Awaitable[types.PaginatedResult]],
+    ) -> types.ServerResult:
+        # Upstream pages are cached (and coalesced) by their cursor, and served in pages of list_page_size items
+        upstream_cursor, offset = request_cursor(req)
+        result = await _cached_list((type(req), upstream_cursor), lambda: load_page(upstream_cursor))
+        return types.ServerResult(paginate(result, items_field, upstream_cursor, offset, list_page_size))
+
+    async def _forward_progress(
+        key: Hashable, progress: float, total: float | None, message: str | None, send: ProgressSendFn
+    ) -> None:
+        if progress_throttle is None:
+            await send(progress, total, message)
+        else:
+            await progress_throttle.report(key, progress, total, message, send)
+
+    def _progress_callback(req: types.CallToolRequest) -> tuple[Hashable, ProgressFnT] | None:
+        """Return the key and a callback forwarding progress of the remote server, if the client asked for it."""
+        progress_token = req.params.meta.progressToken if req.params.meta else None
+        if progress_token is None:
+            return None
+        ctx = app.request_context
+        # Progress tokens are chosen by clients, so they are only unique within a client session
+        key = (ctx.session, progress_token)
+
+        async def _send(progress: float, total: float | None, message: str | None) -> None:
+            await ctx.session.send_progress_notification(
+                progress_token, progress, total, message, related_request_id=str(ctx.request_id)
+            )
+
+        async def _callback(progress: float, total: float | None, message: str | None) -> None:
+            await _forward_progress(key, progress, total, message, _send)
+
+        return key, _callback
+
     logger.debug('Sending initialization request to remote MCP server...')
     response = await client_session.initialize()
     capabilities: types.ServerCapabilities = response.capabilities
@@ -76,16 +170,19 @@ async def create_gateway(  # noqa: PLR0915
     if capabilities.prompts:
         logger.debug('Capabilities: adding Prompts...')
 
-        async def _list_prompts(_: Any) -> types.ServerResult:
-            result = await client_session.list_prompts()
-            return types.ServerResult(result)
+        async def _list_prompts(req: types.ListPromptsRequest) -> types.ServerResult:
+            return await _list_page(
+                req, 'prompts', lambda cursor: client_session.list_prompts(params=page_params(cursor))
+            )
 
         app.request_handlers[types.ListPromptsRequest] = _list_prompts
 
         async def _get_prompt(req: types.GetPromptRequest) -> types.ServerResult:
             # Uncomment the line below to charge for getting prompts
             # await charge_mcp_operation(actor_charge_function, ChargeEvents.PROMPT_GET) # noqa: ERA001
-            result = await client_session.get_prompt(req.params.name, req.params.arguments)
+            arguments = req.params.arguments
+            key = (types.GetPromptRequest, req.params.name, tuple(sorted((arguments or {}).items())))
+            result = await _coalesced(key, lambda: client_session.get_prompt(req.params.name, arguments))
             return types.ServerResult(result)
 
         app.request_handlers[types.GetPromptRequest] = _get_prompt
@@ -93,22 +190,27 @@ async def create_gateway(  # noqa: PLR0915
     if capabilities.resources:
         logger.debug('Capabilities: adding Resources...')
 
-        async def _list_resources(_: Any) -> types.ServerResult:
-            result = await client_session.list_resources()
-            return types.ServerResult(result)
+        async def _list_resources(req: types.ListResourcesRequest) -> types.ServerResult:
+            return await _list_page(
+                req, 'resources', lambda cursor: client_session.list_resources(params=page_params(cursor))
+            )
 
         app.request_handlers[types.ListResourcesRequest] = _list_resources
 
-        async def _list_resource_templates(_: Any) -> types.ServerResult:
-            result = await client_session.list_resource_templates()
-            return types.ServerResult(result)
+        async def _list_resource_templates(req: types.ListResourceTemplatesRequest) -> types.ServerResult:
+            return await _list_page(
+                req,
+                'resourceTemplates',
+                lambda cursor: client_session.list_resource_templates(params=page_params(cursor)),
+            )
 
         app.request_handlers[types.ListResourceTemplatesRequest] = _list_resource_templates
 
         async def _read_resource(req: types.ReadResourceRequest) -> types.ServerResult:
             # Uncomment the line below to charge for reading resources
             # await charge_mcp_operation(actor_charge_function, ChargeEvents.RESOURCE_READ)  # noqa: ERA001
-            result = await client_session.read_resource(req.params.uri)
+            key = (types.ReadResourceRequest, str(req.params.uri))
+            result = await _coalesced(key, lambda: client_session.read_resource(req.params.uri))
             return types.ServerResult(result)
 
         app.request_handlers[types.ReadResourceRequest] = _read_resource
@@ -140,22 +242,39 @@ async def create_gateway(  # noqa: PLR0915
     if capabilities.tools:
         logger.debug('Capabilities: adding Tools...')
 
-        async def _list_tools(_: Any) -> types.ServerResult:
-            tools = await client_session.list_tools()
+        async def _load_tools(cursor: str | None) -> types.ListToolsResult:
+            tools = await client_session.list_tools(params=page_params(cursor))
 
-            # Filter tools to only include authorized ones if whitelist is provided
+            # Filter tools to only include authorized ones if whitelist is provided (page by page)
             if tool_whitelist:
-                authorized_tools = []
-                for tool in tools.tools:
-                    if tool.name in tool_whitelist:
-                        authorized_tools.append(tool)  # noqa: PERF401
-                tools.tools = authorized_tools
+                tools.tools = [tool for tool in tools.tools if tool.name in tool_whitelist]
 
-            return types.ServerResult(tools)
+            if argument_validator:
+                # Listing starts over at the first page, so tools of later pages are added to the known ones
+                argument_validator.update(tools.tools, replace=cursor is None)
+            return tools
+
+        async def _list_tools(req: types.ListToolsRequest) -> types.ServerResult:
+            # Cached pages are already filtered by the whitelist
+            return await _list_page(req, 'tools', _load_tools)
 
         app.request_handlers[types.ListToolsRequest] = _list_tools
 
         async def _call_tool(req: types.CallToolRequest) -> types.ServerResult:
+            if metrics is None:
+                return await _handle_tool_call(req)
+
+            started_at = time.perf_counter()
+            metrics.tool_calls_in_flight += 1
+            try:
+                return await _handle_tool_call(req)
+            finally:
+                metrics.tool_calls_in_flight -= 1
+                # Keep unauthorized tool names out of the metrics, they are arbitrary client input
+                if not tool_whitelist or req.params.name in tool_whitelist:
+                    metrics.observe_tool_call(req.params.name, time.perf_counter() - started_at)
+
+        async def _handle_tool_call(req: types.CallToolRequest) -> types.ServerResult:  # noqa: PLR0911
             tool_name = req.params.name
             arguments = req.params.arguments or {}
 
@@ -173,18 +292,67 @@ async def create_gateway(  # noqa: PLR0915
                     types.CallToolResult(content=[types.TextContent(type='text', text=error_message)], isError=True),
                 )
 
+            # Determine event name and count for charging (default to TOOL_CALL if not whitelisted)
+            default_tool_call = ChargeEvents.TOOL_CALL.value, 1
+            event_name, default_count = (
+                tool_whitelist.get(tool_name, default_tool_call) if tool_whitelist else default_tool_call
+            )
+
+            # Reject malformed calls without a round trip to the remote server
+            if argument_validator and (problem := argument_validator.validate(tool_name, arguments)):
+                logger.warning(f"Rejected tool call of '{tool_name}' with invalid arguments: {problem}")
+                error_message = f"Invalid arguments for tool '{tool_name}': {problem}"
+                return types.ServerResult(
+                    types.CallToolResult(content=[types.TextContent(type='text', text=error_message)], isError=True),
+                )
+
+            if tool_result_cache and (cached := tool_result_cache.get(tool_name, arguments)):
+                logger.info(f'Serving cached result of tool: {tool_name}')
+                if tool_result_cache.charges_on_hit(tool_name):
+                    await charge_mcp_operation(actor_charge_function, event_name, default_count)
+                return types.ServerResult(cached)
+
+            progress = _progress_callback(req)
             try:
                 logger.info(f"Tool call. Tool: '{tool_name}', Arguments: {arguments}")
-                result = await client_session.call_tool(tool_name, arguments)
+                async with admission_control.admit(tool_name) if admission_control else contextlib.nullcontext():
+                    upstream_started_at = time.perf_counter()
+                    with (
+                        in_flight_calls.track(current_session_key.get(), tool_name)
+                        if in_flight_calls
+                        else contextlib.nullcontext()
+                    ) as call:
+                        # The latest progress held back by the throttle is forwarded before the result
+                        async with (
+                            progress_throttle.request(progress[0])
+                            if progress and progress_throttle
+                            else contextlib.nullcontext()
+                        ):
+                            result = await client_session.call_tool(
+                                tool_name, arguments, progress_callback=progress[1] if progress else None
+                            )
+                    if metrics:
+                        metrics.observe_upstream_call(tool_name, time.perf_counter() - upstream_started_at)
+                if call is not None and call.cancel_reason:
+                    # The call was stopped, the remote server was told to stop working on it
+                    logger.warning(f"Stopped tool call of '{tool_name}': {call.cancel_reason}")
+                    return types.ServerResult(
+                        types.CallToolResult(
+                            content=[types.TextContent(type='text', text=call.error_message(tool_name))], isError=True
+                        ),
+                    )
                 logger.info(f'Tool executed successfully: {tool_name}')
 
-                # Determine event name and count for charging (default to TOOL_CALL if not whitelisted)
-                default_tool_call = ChargeEvents.TOOL_CALL.value, 1
-                event_name, default_count = (
-                    tool_whitelist.get(tool_name, default_tool_call) if tool_whitelist else default_tool_call
-                )
+                if tool_result_cache:
+                    tool_result_cache.put(tool_name, arguments, result)
                 await charge_mcp_operation(actor_charge_function, event_name, default_count)
                 return types.ServerResult(result)
+            except ToolOverloadedError as e:
+                logger.warning(f"Rejected tool call of '{tool_name}': {e}")
+                error_message = f"The server is overloaded, try calling the tool '{tool_name}' again later. {e}"
+                return types.ServerResult(
+                    types.CallToolResult(content=[types.TextContent(type='text', text=error_message)], isError=True),
+                )
             except Exception as e:
                 error_details = f"SERVER FAILED. Tool: '{tool_name}'. Arguments: {arguments}. Full exception: {e}"
                 logger.exception(error_details)
@@ -195,11 +363,12 @@ async def create_gateway(  # noqa: PLR0915
         app.request_handlers[types.CallToolRequest] = _call_tool
 
     async def _send_progress_notification(req: types.ProgressNotification) -> None:
-        await client_session.send_progress_notification(
-            req.params.progressToken,
-            req.params.progress,
-            req.params.total,
-        )
+        async def _send(progress: float, total: float | None, message: str | None) -> None:
+            await client_session.send_progress_notification(req.params.progressToken, progress, total, message)
+
+        # Notifications have no request context; the token is scoped by the session through its event store key
+        key = (current_session_key.get(), req.params.progressToken)
+        await _forward_progress(key, req.params.progress, req.params.total, req.params.message, _send)
 
     app.notification_handlers[types.ProgressNotification] = _send_progress_notification
 
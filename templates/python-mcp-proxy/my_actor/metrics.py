@@ -0,0 +1,136 @@
+"""Metrics of the proxy in the Prometheus text exposition format.
+
+Recording on the hot path only increments counters of preallocated histogram buckets; cumulative bucket
+counts and the text output are computed when `/metrics` is scraped.
+"""
+
+from __future__ import annotations
+
+import bisect
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Upper bounds of latency histogram buckets, in seconds
+LATENCY_BUCKETS_SECS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Samples of a metric as (labels, value) pairs
+Samples = list[tuple[dict[str, str], float]]
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label_value(value)}"' for name, value in labels.items()) + '}'
+
+
+def format_metric(name: str, help_text: str, metric_type: str, samples: Samples) -> list[str]:
+    """Format a counter or gauge with its HELP and TYPE lines."""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+    lines.extend(f'{name}{_format_labels(labels)} {value}' for labels, value in samples)
+    return lines
+
+
+class Histogram:
+    """Histogram of observed values with fixed bucket bounds."""
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS_SECS) -> None:
+        self.bounds = bounds
+        # Non-cumulative counts per bucket; the last one counts values above the highest bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Record an observed value."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: dict[str, str]) -> list[str]:
+        """Return the bucket, sum and count lines of the histogram."""
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.bounds, '+Inf'), self.counts, strict=True):
+            cumulative += count
+            lines.append(f'{name}_bucket{_format_labels({**labels, "le": str(bound)})} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {self.sum}')
+        lines.append(f'{name}_count{_format_labels(labels)} {self.count}')
+        return lines
+
+
+class ProxyMetrics:
+    """Latency histograms and in-flight counters recorded by the proxy.
+
+    Attributes:
+        tool_call_latency: End-to-end duration of tool calls handled by the gateway, by tool name
+        upstream_latency: Duration of tool calls forwarded to the upstream server, by tool name
+        tool_calls_in_flight: Number of tool calls currently handled by the gateway
+        requests_in_flight: Number of HTTP requests to /mcp currently handled (including open SSE streams)
+    """
+
+    def __init__(self) -> None:
+        self.tool_call_latency: dict[str, Histogram] = {}
+        self.upstream_latency: dict[str, Histogram] = {}
+        self.tool_calls_in_flight = 0
+        self.requests_in_flight = 0
+
+    def observe_tool_call(self, tool_name: str, duration_secs: float) -> None:
+        """Record the end-to-end duration of a tool call."""
+        if (histogram := self.tool_call_latency.get(tool_name)) is None:
+            histogram = self.tool_call_latency[tool_name] = Histogram()
+        histogram.observe(duration_secs)
+
+    def observe_upstream_call(self, tool_name: str, duration_secs: float) -> None:
+        """Record the duration of a tool call forwarded to the upstream server."""
+        if (histogram := self.upstream_latency.get(tool_name)) is None:
+            histogram = self.upstream_latency[tool_name] = Histogram()
+        histogram.observe(duration_secs)
+
+    def render(
+        self, gauges: Iterable[tuple[str, str, Samples]] = (), counters: Iterable[tuple[str, str, Samples]] = ()
+    ) -> str:
+        """Render the metrics, followed by the given (name, help, samples) gauges and counters, in the text format.
+
+        Counters only ever increase while the proxy runs; their names end with `_total`.
+        """
+        lines = [
+            *format_metric(
+                'mcp_tool_calls_in_flight',
+                'Tool calls currently handled by the proxy.',
+                'gauge',
+                [({}, self.tool_calls_in_flight)],
+            ),
+            *format_metric(
+                'mcp_http_requests_in_flight',
+                'HTTP requests to /mcp currently handled, including open SSE streams.',
+                'gauge',
+                [({}, self.requests_in_flight)],
+            ),
+        ]
+        for name, help_text, histograms in (
+            (
+                'mcp_tool_call_duration_seconds',
+                'End-to-end duration of tool calls handled by the proxy.',
+                self.tool_call_latency,
+            ),
+            (
+                'mcp_upstream_tool_call_duration_seconds',
+                'Duration of tool calls forwarded to the upstream MCP server.',
+                self.upstream_latency,
+            ),
+        ):
+            lines.extend((f'# HELP {name} {help_text}', f'# TYPE {name} histogram'))
+            for tool_name, histogram in histograms.items():
+                lines.extend(histogram.samples(name, {'tool': tool_name}))
+        for name, help_text, samples in gauges:
+            lines.extend(format_metric(name, help_text, 'gauge', samples))
+        for name, help_text, samples in counters:
+            lines.extend(format_metric(name, help_text, 'counter', samples))
+        return '\n'.join(lines) + '\n'
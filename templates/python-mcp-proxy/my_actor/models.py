@@ -34,3 +34,18 @@ class RemoteServerParameters(BaseModel):
 
 # Type alias for server parameters
 ServerParameters: TypeAlias = StdioServerParameters | RemoteServerParameters
+
+
+class UpstreamServer(BaseModel):
+    """An MCP server served next to others behind a single endpoint.
+
+    Attributes:
+        name: Name the server is mounted under; its tools and prompts are served as `<name>__<tool>`
+        server_type: Type of the server (stdio, SSE, or HTTP)
+        config: Parameters for connecting to the server
+    """
+
+    name: str
+    server_type: ServerType
+    config: ServerParameters
+    model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -0,0 +1,71 @@
+"""Cursor-based pagination of list results served by the gateway.
+
+The gateway lists the upstream server page by page, following the cursors of the upstream server, and
+serves every upstream page in pages of at most `page_size` items. Cursors given to clients are opaque:
+each one encodes the cursor of an upstream page and the offset of the next item within that page (after
+the page was filtered, for example by the tool whitelist).
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from typing import TYPE_CHECKING, TypeVar
+
+from mcp.shared.exceptions import McpError
+from mcp.types import INVALID_PARAMS, ErrorData, PaginatedRequestParams, PaginatedResult
+
+if TYPE_CHECKING:
+    from mcp.types import PaginatedRequest
+
+R = TypeVar('R', bound=PaginatedResult)
+
+
+def encode_cursor(upstream_cursor: str | None, offset: int) -> str:
+    """Create the cursor of the page starting at `offset` of the upstream page with cursor `upstream_cursor`."""
+    return base64.urlsafe_b64encode(json.dumps([upstream_cursor, offset], separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str | None, int]:
+    """Return the upstream cursor and offset encoded in a cursor; raise an invalid params error if it is malformed."""
+    try:
+        upstream_cursor, offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message=f'Invalid cursor: {cursor}')) from e
+    if not (upstream_cursor is None or isinstance(upstream_cursor, str)) or not isinstance(offset, int) or offset < 0:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message=f'Invalid cursor: {cursor}'))
+    return upstream_cursor, offset
+
+
+def request_cursor(request: PaginatedRequest | None) -> tuple[str | None, int]:
+    """Return the upstream cursor and offset of the page a list request asks for (the first page if none)."""
+    if request is None or request.params is None or request.params.cursor is None:
+        return None, 0
+    return decode_cursor(request.params.cursor)
+
+
+def page_params(upstream_cursor: str | None) -> PaginatedRequestParams | None:
+    """Create the params of a list request to the upstream server for the page with the given cursor."""
+    return None if upstream_cursor is None else PaginatedRequestParams(cursor=upstream_cursor)
+
+
+def paginate(result: R, items_field: str, upstream_cursor: str | None, offset: int, page_size: int | None) -> R:
+    """Return the page of an upstream list result starting at `offset`, with the cursor of the next page.
+
+    Args:
+        result: List result of the upstream server for `upstream_cursor`, already filtered
+        items_field: Name of the field of the result holding the listed items, such as 'tools'
+        upstream_cursor: Cursor the upstream page was listed with (None for the first page)
+        offset: Index of the first item of the page in the upstream page
+        page_size: Maximum number of items in a page; if None (or not positive), upstream pages are served whole
+    """
+    items = getattr(result, items_field)
+    end = len(items) if page_size is None or page_size <= 0 else offset + page_size
+    if end < len(items):
+        next_cursor = encode_cursor(upstream_cursor, end)
+    elif result.nextCursor is not None:
+        next_cursor = encode_cursor(result.nextCursor, 0)
+    else:
+        next_cursor = None
+    return result.model_copy(update={items_field: items[offset:end], 'nextCursor': next_cursor})
@@ -0,0 +1,481 @@
+"""Raw passthrough of tool calls and resource reads to a Streamable HTTP server.
+
+Through the gateway, every result of the remote server is validated into `mcp.types` models by the client
+session and serialized again for the client, which costs a lot of CPU for large results. In passthrough
+mode, `tools/call` and `resources/read` requests are forwarded to the remote server as they are and its
+response bytes are relayed to the client. Only the small request envelope is parsed (for whitelisting,
+argument validation and charging); the request ID is replaced by a unique one for the remote session and
+restored in the `"id"` member of the response by a byte substitution, without parsing the result.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import re
+import time
+from typing import TYPE_CHECKING, Any
+from uuid import uuid4
+
+import anyio
+import httpx
+from mcp.shared._httpx_utils import create_mcp_http_client
+from mcp.types import INTERNAL_ERROR
+
+from .admission import ToolOverloadedError
+from .cancellation import CANCEL_NOTIFICATION_TIMEOUT_SECS
+from .const import ChargeEvents
+from .event_store import current_session_key
+from .mcp_gateway import charge_mcp_operation
+from .progress import ProgressEventFilter, is_final_progress
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from mcp.client.streamable_http import GetSessionIdCallback
+    from starlette.types import Send
+
+    from .admission import ToolAdmissionControl
+    from .cache import ToolResultCache
+    from .cancellation import InFlightCalls
+    from .metrics import ProxyMetrics
+    from .models import RemoteServerParameters
+    from .progress import ProgressThrottle
+    from .validation import ToolArgumentValidator
+
+logger = logging.getLogger('apify')
+
+# Requests whose (potentially large) results are relayed without being parsed
+PASSTHROUGH_METHODS = frozenset({'tools/call', 'resources/read'})
+# Response frames larger than this are results; error responses are always small
+ERROR_FRAME_MAX_BYTES = 64 * 1024
+
+
+def is_error_frame(frame: bytes) -> bool:
+    """Return whether a serialized JSON-RPC response is an error response."""
+    if len(frame) > ERROR_FRAME_MAX_BYTES:
+        return False
+    try:
+        message = json.loads(frame)
+    except ValueError:
+        return False
+    return isinstance(message, dict) and 'error' in message
+
+
+def restore_request_id(frame: bytes, upstream_id: bytes, request_id: bytes) -> bytes | None:
+    """Return the serialized response with the ID of the client's request, or None if it is not the response.
+
+    The ID is replaced in the `"id"` member holding the upstream ID, wherever the upstream server put it
+    in the message. If the result also holds such a member, the message is parsed to replace only the ID
+    of the response.
+    """
+    pattern = re.compile(rb'"id"\s*:\s*(' + re.escape(upstream_id) + rb')')
+    if (match := pattern.search(frame)) is None:
+        return None
+    if pattern.search(frame, match.end()) is None:
+        return frame[: match.start(1)] + request_id + frame[match.end(1) :]
+    message = json.loads(frame)
+    message['id'] = json.loads(request_id)
+    return json.dumps(message).encode()
+
+
+def parse_progress_frame(frame: bytes) -> tuple[float, float | None] | None:
+    """Return the progress and total of a serialized progress notification, or None for other messages."""
+    if b'notifications/progress' not in frame or len(frame) > ERROR_FRAME_MAX_BYTES:
+        return None
+    try:
+        message = json.loads(frame)
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or message.get('method') != 'notifications/progress':
+        return None
+    params = message.get('params') or {}
+    return params.get('progress', 0), params.get('total')
+
+
+class EventStreamRelay:
+    """Relay of an SSE response of the remote server to the client.
+
+    Events are relayed as they are, except that the ID of the request is restored in the response event, and
+    event IDs are dropped, as they refer to the event store of the remote server (resuming the stream through
+    the proxy is not possible). Progress notifications are throttled if a filter is given.
+
+    Attributes:
+        response_seen: Whether the response to the request was received
+        response_relayed: Whether the event holding the response was relayed
+        response_is_error: Whether the response was a JSON-RPC error
+    """
+
+    def __init__(self, upstream_id: bytes, request_id: bytes, progress: ProgressEventFilter | None = None) -> None:
+        self.response_seen = False
+        self.response_relayed = False
+        self.response_is_error = False
+        self._upstream_id = upstream_id
+        self._request_id = request_id
+        self._progress = progress
+        # Start of an incomplete line; a large event is only relayed once it is complete
+        self._partial: list[bytes] = []
+        # Relayed lines of the current event, which is relayed once complete
+        self._event: list[bytes] = []
+        self._event_progress: tuple[float, float | None] | None = None
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Process a chunk of the stream and return the bytes to send to the client."""
+        if b'\n' not in chunk:
+            self._partial.append(chunk)
+            return b''
+        data = b''.join((*self._partial, chunk)) if self._partial else chunk
+        *lines, rest = data.split(b'\n')
+        self._partial = [rest] if rest else []
+        return b''.join([self._relay_line(line) for line in lines])
+
+    def flush(self) -> bytes:
+        """Return the rest of the stream after its last line break."""
+        rest = b''.join(self._partial)
+        self._partial = []
+        data = self._relay_line(rest) if rest else b''
+        if self._event:
+            data += self._end_event()
+        return data + (self._progress.flush() if self._progress else b'')
+
+    def _relay_line(self, line: bytes) -> bytes:
+        if not line.strip(b'\r'):
+            self._event.append(line + b'\n')
+            return self._end_event()
+        if line.startswith(b'id:'):
+            return b''
+        if line.startswith(b'data:'):
+            frame = None
+            if not self.response_seen and self._upstream_id in line:
+                frame = restore_request_id(line[5:], self._upstream_id, self._request_id)
+            if frame is not None:
+                self.response_seen = True
+                line = b'data:' + frame
+                self.response_is_error = is_error_frame(frame)
+            elif self._progress:
+                self._event_progress = parse_progress_frame(line[5:])
+        self._event.append(line + b'\n')
+        return b''
+
+    def _end_event(self) -> bytes:
+        event = b''.join(self._event)
+        self._event = []
+        self.response_relayed = self.response_seen
+        progress, self._event_progress = self._event_progress, None
+        if self._progress is None:
+            return event
+        return self._progress.filter(
+            event, is_progress=progress is not None, is_final=progress is not None and is_final_progress(*progress)
+        )
+
+
+class RawPassthrough:
+    """Forwarder of raw `tools/call` and `resources/read` requests to a Streamable HTTP server.
+
+    Requests are forwarded in the MCP session the proxy opened with the remote server. Calls of tools
+    that are not authorized, have invalid arguments, or have cached or hedged results are left to the gateway,
+    so are other requests.
+
+    Attributes:
+        forwarded: Number of requests forwarded in passthrough mode
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        params: RemoteServerParameters,
+        get_upstream_session_id: GetSessionIdCallback,
+        get_upstream_protocol_version: Callable[[], str | None],
+        actor_charge_function: Callable[[str, int], Awaitable[Any]] | None = None,
+        tool_whitelist: dict[str, tuple[str, int]] | None = None,
+        tool_result_cache: ToolResultCache | None = None,
+        admission_control: ToolAdmissionControl | None = None,
+        metrics: ProxyMetrics | None = None,
+        argument_validator: ToolArgumentValidator | None = None,
+        in_flight_calls: InFlightCalls | None = None,
+        progress_throttle: ProgressThrottle | None = None,
+        hedged_tools: set[str] | None = None,
+    ) -> None:
+        """Initialize the passthrough.
+
+        Args:
+            params: Parameters of the remote server the requests are forwarded to
+            get_upstream_session_id: Callback returning the ID of the proxy's session with the remote server
+            get_upstream_protocol_version: Callback returning the protocol version negotiated in that session
+            actor_charge_function: Optional function to charge for tool calls, as in the gateway
+            tool_whitelist: Optional dict mapping tool names to (event_name, default_count) tuples, as in
+                           the gateway. Calls of other tools are left to the gateway, which rejects them.
+            tool_result_cache: Optional cache of tool results; calls of cached tools are left to the gateway
+            admission_control: Optional concurrency limits of tool calls, shared with the gateway
+            metrics: Optional metrics recording latencies of tool calls
+            argument_validator: Optional validator of tool call arguments; invalid calls are left to the gateway
+            in_flight_calls: Optional tracking of tool calls, which stops them at their deadline or when the
+                           client session is closed, shared with the gateway
+            progress_throttle: Optional rate limit of progress notifications relayed to the client
+            hedged_tools: Optional names of tools whose calls are hedged by the gateway; they are left to it
+        """
+        self.url = params.url
+        self.forwarded = 0
+        self._get_upstream_session_id = get_upstream_session_id
+        self._get_upstream_protocol_version = get_upstream_protocol_version
+        self._charge_function = actor_charge_function
+        self._tool_whitelist = tool_whitelist
+        self._tool_result_cache = tool_result_cache
+        self._hedged_tools = hedged_tools or set()
+        self._admission_control = admission_control
+        self._metrics = metrics
+        self._argument_validator = argument_validator
+        self._in_flight_calls = in_flight_calls
+        self._progress_throttle = progress_throttle
+        # (session key, serialized request ID) -> cancel scope of a request being passed through
+        self._cancel_scopes: dict[tuple[str, bytes], anyio.CancelScope] = {}
+        self._client = create_mcp_http_client(
+            headers=params.headers,
+            timeout=httpx.Timeout(params.timeout, read=params.sse_read_timeout),
+            auth=params.auth,
+        )
+
+    async def aclose(self) -> None:
+        """Close the HTTP client."""
+        await self._client.aclose()
+
+    def _tool_name(self, message: dict[str, Any]) -> str | None:
+        """Return the name of the called tool if the call can be passed through, otherwise None."""
+        params = message.get('params')
+        if not isinstance(params, dict) or not isinstance(tool_name := params.get('name'), str):
+            return None
+        if self._tool_whitelist and tool_name not in self._tool_whitelist:
+            return None
+        if self._tool_result_cache and tool_name in self._tool_result_cache.tool_config:
+            return None
+        if tool_name in self._hedged_tools:
+            return None
+        arguments = params.get('arguments') or {}
+        if self._argument_validator and self._argument_validator.validate(tool_name, arguments):
+            return None
+        return tool_name
+
+    async def handle(self, body: bytes, send: Send, session_id: str | None) -> bool:
+        """Forward the request if it can be passed through and relay the response to the client.
+
+        Args:
+            body: Body of the POST request of the client
+            send: ASGI `send` of the client's request
+            session_id: ID of the client's MCP session, included in the response headers
+
+        Returns:
+            Whether the request was handled; if not, it must be handled by the gateway
+        """
+        try:
+            message = json.loads(body)
+        except ValueError:
+            return False
+        if not isinstance(message, dict):
+            return False
+        if message.get('method') == 'notifications/cancelled' and self._cancel(message):
+            await send({'type': 'http.response.start', 'status': 202, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+            return True
+        if message.get('method') not in PASSTHROUGH_METHODS or 'id' not in message:
+            return False
+        tool_name = None
+        if message['method'] == 'tools/call' and (tool_name := self._tool_name(message)) is None:
+            return False
+
+        request_id = message['id']
+        upstream_id = f'passthrough-{uuid4().hex}'
+        message['id'] = upstream_id
+        request = _Request(
+            body=json.dumps(message, separators=(',', ':')).encode(),
+            upstream_id=json.dumps(upstream_id).encode(),
+            request_id=json.dumps(request_id).encode(),
+            send=send,
+            session_id=session_id,
+        )
+        self.forwarded += 1
+        # The client may cancel the request with a notification, which arrives in another HTTP request
+        key = (current_session_key.get(), request.request_id)
+        with anyio.CancelScope() as scope:
+            self._cancel_scopes[key] = scope
+            try:
+                await self._dispatch(request, message['method'], tool_name, request_id)
+            finally:
+                self._cancel_scopes.pop(key, None)
+        # A cancelled request gets no response, the client does not expect one anymore
+        if scope.cancelled_caught:
+            await request.abandon(None)
+        return True
+
+    def _cancel(self, message: dict[str, Any]) -> bool:
+        """Cancel the passed through request the client's `notifications/cancelled` refers to, if there is one."""
+        params = message.get('params')
+        if not isinstance(params, dict) or 'requestId' not in params:
+            return False
+        scope = self._cancel_scopes.get((current_session_key.get(), json.dumps(params['requestId']).encode()))
+        if scope is None:
+            return False
+        scope.cancel()
+        return True
+
+    async def _dispatch(self, request: _Request, method: str, tool_name: str | None, request_id: Any) -> None:
+        if tool_name is None:
+            logger.info(f'Passing through {method} request')
+            await self._forward(request, lambda e: _error_response(request_id, f'SERVER FAILED. {e}'))
+            return
+
+        if self._metrics is None:
+            await self._call_tool(request, tool_name, request_id)
+            return
+        started_at = time.perf_counter()
+        self._metrics.tool_calls_in_flight += 1
+        try:
+            await self._call_tool(request, tool_name, request_id)
+        finally:
+            self._metrics.tool_calls_in_flight -= 1
+            self._metrics.observe_tool_call(tool_name, time.perf_counter() - started_at)
+
+    async def _call_tool(self, request: _Request, tool_name: str, request_id: Any) -> None:
+        logger.info(f"Passing through tool call, tool: '{tool_name}'")
+        admission_control = self._admission_control
+        try:
+            async with admission_control.admit(tool_name) if admission_control else contextlib.nullcontext():
+                upstream_started_at = time.perf_counter()
+                succeeded = False
+                with (
+                    self._in_flight_calls.track(current_session_key.get(), tool_name)
+                    if self._in_flight_calls
+                    else contextlib.nullcontext()
+                ) as call:
+                    succeeded = await self._forward(
+                        request,
+                        lambda e: _tool_error_result(
+                            request_id, f"SERVER FAILED. Tool: '{tool_name}'. Full exception: {e}"
+                        ),
+                    )
+                if call is not None and call.cancel_reason:
+                    logger.warning(f"Stopped tool call of '{tool_name}': {call.cancel_reason}")
+                    await request.abandon(_tool_error_result(request_id, call.error_message(tool_name)))
+                if self._metrics:
+                    self._metrics.observe_upstream_call(tool_name, time.perf_counter() - upstream_started_at)
+        except ToolOverloadedError as e:
+            logger.warning(f"Rejected tool call of '{tool_name}': {e}")
+            error_message = f"The server is overloaded, try calling the tool '{tool_name}' again later. {e}"
+            await request.respond(_tool_error_result(request_id, error_message))
+            return
+
+        if succeeded:
+            default_tool_call = ChargeEvents.TOOL_CALL.value, 1
+            event_name, default_count = (
+                self._tool_whitelist.get(tool_name, default_tool_call) if self._tool_whitelist else default_tool_call
+            )
+            await charge_mcp_operation(self._charge_function, event_name, default_count)
+
+    async def _forward(self, request: _Request, error_response: Callable[[Exception], bytes]) -> bool:
+        """Forward the request and relay the response; return whether it was a successful result."""
+        headers = {'accept': 'application/json, text/event-stream', 'content-type': 'application/json'}
+        if upstream_session_id := self._get_upstream_session_id():
+            headers['mcp-session-id'] = upstream_session_id
+        # The request is sent in the proxy's session, so it carries the version negotiated in that session
+        if protocol_version := self._get_upstream_protocol_version():
+            headers['mcp-protocol-version'] = protocol_version
+
+        try:
+            async with self._client.stream('POST', self.url, content=request.body, headers=headers) as response:
+                response.raise_for_status()
+                if response.headers.get('content-type', '').startswith('text/event-stream'):
+                    return await self._relay_event_stream(request, response)
+                body = await response.aread()
+                body = restore_request_id(body, request.upstream_id, request.request_id) or body
+                await request.respond(body)
+                return not is_error_frame(body)
+        except anyio.get_cancelled_exc_class():
+            # Tell the remote server to stop working on the request; shielded, as this task is cancelled
+            with anyio.move_on_after(CANCEL_NOTIFICATION_TIMEOUT_SECS, shield=True):
+                await self._send_cancelled(request, headers)
+            raise
+        except Exception as e:
+            logger.exception('Failed to pass the request through to the remote MCP server')
+            await request.abandon(error_response(e))
+            return False
+
+    async def _send_cancelled(self, request: _Request, headers: dict[str, str]) -> None:
+        notification = (
+            b'{"jsonrpc":"2.0","method":"notifications/cancelled","params":{"requestId":' + request.upstream_id + b'}}'
+        )
+        try:
+            response = await self._client.post(self.url, content=notification, headers=headers)
+            response.raise_for_status()
+        except Exception as e:
+            logger.debug(f'Failed to send cancellation of a passed through request upstream: {e!r}')
+
+    async def _relay_event_stream(self, request: _Request, response: httpx.Response) -> bool:
+        progress = ProgressEventFilter(self._progress_throttle) if self._progress_throttle else None
+        relay = EventStreamRelay(request.upstream_id, request.request_id, progress)
+        await request.start(b'text/event-stream', [(b'cache-control', b'no-cache, no-transform')])
+        async for chunk in response.aiter_bytes():
+            if data := relay.feed(chunk):
+                request.responded = relay.response_relayed
+                await request.send({'type': 'http.response.body', 'body': data, 'more_body': True})
+        await request.send({'type': 'http.response.body', 'body': relay.flush(), 'more_body': False})
+        request.finished = True
+        return relay.response_seen and not relay.response_is_error
+
+
+class _Request:
+    """A request forwarded in passthrough mode, with the state of the response to the client."""
+
+    def __init__(self, body: bytes, upstream_id: bytes, request_id: bytes, send: Send, session_id: str | None) -> None:
+        self.body = body
+        # Serialized request IDs used with the remote server and by the client
+        self.upstream_id = upstream_id
+        self.request_id = request_id
+        self.send = send
+        self.session_id = session_id
+        self.started = False
+        self.event_stream = False
+        self.responded = False
+        self.finished = False
+
+    async def start(self, content_type: bytes, headers: list[tuple[bytes, bytes]]) -> None:
+        """Send the status and headers of the response."""
+        headers = [(b'content-type', content_type), *headers]
+        if self.session_id:
+            headers.append((b'mcp-session-id', self.session_id.encode()))
+        self.started = True
+        self.event_stream = content_type == b'text/event-stream'
+        await self.send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    async def abandon(self, error_body: bytes | None) -> None:
+        """End the response of a request that was stopped, with the error if nothing was sent yet.
+
+        Without an error, as for a request cancelled by the client, the response ends without a message.
+        """
+        if not self.started and error_body is None:
+            await self.start(b'text/event-stream', [(b'cache-control', b'no-cache, no-transform')])
+        if not self.started:
+            await self.respond(error_body)
+        elif not self.finished:
+            # An event stream can still carry the error, unless the response was relayed already
+            body = (
+                b'event: message\ndata: ' + error_body + b'\n\n'
+                if error_body is not None and self.event_stream and not self.responded
+                else b''
+            )
+            self.finished = True
+            await self.send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+    async def respond(self, body: bytes) -> None:
+        """Send a complete JSON response."""
+        await self.start(b'application/json', [(b'content-length', str(len(body)).encode())])
+        self.responded = self.finished = True
+        await self.send({'type': 'http.response.body', 'body': body})
+
+
+def _tool_error_result(request_id: Any, error_message: str) -> bytes:
+    result = {'content': [{'type': 'text', 'text': error_message}], 'isError': True}
+    return json.dumps({'jsonrpc': '2.0', 'id': request_id, 'result': result}).encode()
+
+
+def _error_response(request_id: Any, error_message: str) -> bytes:
+    error = {'code': INTERNAL_ERROR, 'message': error_message}
+    return json.dumps({'jsonrpc': '2.0', 'id': request_id, 'error': error}).encode()
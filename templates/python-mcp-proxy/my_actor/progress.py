@@ -0,0 +1,211 @@
+"""Throttling of progress notifications forwarded by the proxy.
+
+Tools reporting progress in a tight loop would flood the client session, and through it the event store
+and the SSE stream. Progress of a request is forwarded at most `max_per_sec` times a second: a notification
+arriving sooner after the previous one is held back, and only the latest held notification is forwarded
+once the interval has passed. The final notification (progress reaching the total) is always forwarded
+right away, and so is the held one when the request finishes (see `ProgressThrottle.flush`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import TYPE_CHECKING, TypeAlias
+
+from .const import PROGRESS_MAX_NOTIFICATIONS_PER_SEC
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable
+
+logger = logging.getLogger('apify')
+
+# Sends a progress notification given its progress, total and message
+ProgressSendFn: TypeAlias = Callable[[float, float | None, str | None], Awaitable[None]]
+
+
+def is_final_progress(progress: float, total: float | None) -> bool:
+    """Return whether a progress notification reports that the work is done."""
+    return total is not None and progress >= total
+
+
+class _ProgressState:
+    """Progress notifications of a single token: when one was last forwarded and the latest one held back."""
+
+    __slots__ = ('pending', 'send', 'sent_at', 'timer')
+
+    def __init__(self, send: ProgressSendFn) -> None:
+        self.send = send
+        self.sent_at = 0.0
+        self.pending: tuple[float, float | None, str | None] | None = None
+        self.timer: asyncio.Task | None = None
+
+
+class ProgressThrottle:
+    """Rate limit of progress notifications, per progress token.
+
+    Attributes:
+        interval_secs: Minimum time between two forwarded notifications of a token
+        forwarded: Number of forwarded notifications
+        dropped: Number of notifications replaced by a later one before they were forwarded
+    """
+
+    def __init__(self, max_per_sec: float = PROGRESS_MAX_NOTIFICATIONS_PER_SEC) -> None:
+        """Initialize the throttle.
+
+        Args:
+            max_per_sec: Maximum number of notifications forwarded per second and progress token
+        """
+        self.interval_secs = 1 / max_per_sec
+        self.forwarded = 0
+        self.dropped = 0
+        # Progress token (with anything that scopes it, such as the client session) -> state, in the order
+        # in which notifications were last forwarded
+        self._tokens: OrderedDict[Hashable, _ProgressState] = OrderedDict()
+
+    async def report(
+        self, key: Hashable, progress: float, total: float | None, message: str | None, send: ProgressSendFn
+    ) -> None:
+        """Forward the notification now, or hold it back until the interval of its token has passed."""
+        now = time.monotonic()
+        state = self._tokens.get(key)
+        if state is None:
+            state = self._tokens[key] = _ProgressState(send)
+        state.send = send
+
+        if is_final_progress(progress, total) or now - state.sent_at >= self.interval_secs:
+            self._cancel_timer(state)
+            if state.pending is not None:
+                self.dropped += 1
+                state.pending = None
+            await self._send(key, state, progress, total, message)
+            # While sending, the token may have been discarded (its request failed or its session ended) or
+            # pruned, and a later notification may have started a new state for it
+            if is_final_progress(progress, total) and self._tokens.get(key) is state:
+                del self._tokens[key]
+            now = time.monotonic()
+        else:
+            if state.pending is not None:
+                self.dropped += 1
+            state.pending = (progress, total, message)
+            if state.timer is None:
+                delay_secs = state.sent_at + self.interval_secs - now
+                state.timer = asyncio.create_task(self._send_later(key, state, delay_secs))
+        self._prune(now)
+
+    @contextlib.asynccontextmanager
+    async def request(self, key: Hashable) -> AsyncIterator[None]:
+        """Run the body as the request of the token: when it finishes, forward the notification held back.
+
+        If the body fails, the held back notification is dropped, as the request has no result to precede.
+        """
+        try:
+            yield
+        except BaseException:
+            self.discard(key)
+            raise
+        await self.flush(key)
+
+    def discard(self, key: Hashable) -> None:
+        """Forget the token of a failed request together with the notification held back for it."""
+        if (state := self._tokens.pop(key, None)) is not None:
+            self._cancel_timer(state)
+
+    def discard_session(self, session_key: str) -> None:
+        """Forget the tokens of an ended session (keys of the form `(session_key, progress_token)`)."""
+        for key in [k for k in self._tokens if isinstance(k, tuple) and k[0] == session_key]:
+            self.discard(key)
+
+    async def flush(self, key: Hashable) -> None:
+        """Forward the notification held back for a finished request, if any, and forget its token."""
+        state = self._tokens.pop(key, None)
+        if state is None:
+            return
+        self._cancel_timer(state)
+        if state.pending is not None:
+            progress, total, message = state.pending
+            state.pending = None
+            await self._send(key, state, progress, total, message)
+
+    async def _send_later(self, key: Hashable, state: _ProgressState, delay_secs: float) -> None:
+        await asyncio.sleep(delay_secs)
+        state.timer = None
+        if state.pending is not None:
+            progress, total, message = state.pending
+            state.pending = None
+            await self._send(key, state, progress, total, message)
+
+    async def _send(
+        self, key: Hashable, state: _ProgressState, progress: float, total: float | None, message: str | None
+    ) -> None:
+        state.sent_at = time.monotonic()
+        if key in self._tokens:
+            self._tokens.move_to_end(key)
+        self.forwarded += 1
+        try:
+            await state.send(progress, total, message)
+        except Exception as e:
+            # Progress is best effort; the request itself is not affected
+            logger.debug(f'Failed to forward a progress notification: {e!r}')
+
+    def _prune(self, now: float) -> None:
+        """Forget tokens with nothing held back whose interval has passed, as they behave like unknown ones."""
+        while self._tokens:
+            key, state = next(iter(self._tokens.items()))
+            if state.pending is not None or now - state.sent_at < self.interval_secs:
+                break
+            del self._tokens[key]
+
+    @staticmethod
+    def _cancel_timer(state: _ProgressState) -> None:
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+
+
+class ProgressEventFilter:
+    """Throttle of progress notifications within a single SSE response relayed as raw events.
+
+    Works without timers: a held back notification is replaced by the next one arriving after the interval,
+    and forwarded right before the next other event of the stream (such as the response) at the latest.
+    """
+
+    def __init__(self, throttle: ProgressThrottle) -> None:
+        self._throttle = throttle
+        self._sent_at = 0.0
+        self._pending: bytes | None = None
+
+    def filter(self, event: bytes, *, is_progress: bool, is_final: bool = False) -> bytes:
+        """Return the bytes to relay for the event, including a held back notification that is due."""
+        now = time.monotonic()
+        if not is_progress:
+            # Whatever follows a notification (another message or the response) is preceded by it
+            held, self._pending = self._pending or b'', None
+            if held:
+                self._count_forwarded(now)
+            return held + event
+        if is_final or now - self._sent_at >= self._throttle.interval_secs:
+            if self._pending is not None:
+                self._throttle.dropped += 1
+                self._pending = None
+            self._count_forwarded(now)
+            return event
+        if self._pending is not None:
+            self._throttle.dropped += 1
+        self._pending = event
+        return b''
+
+    def flush(self) -> bytes:
+        """Return the notification held back at the end of the stream, if any."""
+        held, self._pending = self._pending or b'', None
+        if held:
+            self._count_forwarded(time.monotonic())
+        return held
+
+    def _count_forwarded(self, now: float) -> None:
+        self._sent_at = now
+        self._throttle.forwarded += 1
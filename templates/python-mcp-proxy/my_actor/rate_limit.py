@@ -0,0 +1,149 @@
+"""Token-bucket rate limits of requests to /mcp, per MCP session and per bearer token.
+
+Every client session and every bearer token has a bucket refilled at a constant rate up to its burst size;
+a request takes one token from each bucket that applies to it. A request finding an empty bucket is
+rejected right away, so that a single client cannot flood the upstream MCP server and starve the others.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+
+from .const import (
+    RATE_LIMIT_SESSION_BURST,
+    RATE_LIMIT_SESSION_REQUESTS_PER_SEC,
+    RATE_LIMIT_TOKEN_BURST,
+    RATE_LIMIT_TOKEN_REQUESTS_PER_SEC,
+)
+
+# How often buckets that refilled completely are dropped
+PRUNE_INTERVAL_SECS = 60
+
+
+class TokenBucket:
+    """Tokens left in a bucket and the time they were counted at."""
+
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, tokens: float, updated_at: float) -> None:
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class RateLimit:
+    """Token buckets of a single kind of key, all with the same rate and burst size.
+
+    Attributes:
+        name: Kind of the keys used in logs and metrics ('session' or 'token')
+        rate: Number of tokens added to every bucket per second
+        burst: Maximum number of tokens in a bucket
+        rejected: Number of requests rejected because their bucket was empty
+    """
+
+    def __init__(self, name: str, rate: float, burst: float) -> None:
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.rejected = 0
+        self._buckets: dict[str | bytes, TokenBucket] = {}
+        self._pruned_at = time.monotonic()
+
+    def __len__(self) -> int:
+        """Return the number of buckets held."""
+        return len(self._buckets)
+
+    def wait_time(self, key: str | bytes, now: float) -> float:
+        """Refill the key's bucket; return 0 if it holds a token, or the seconds until it will."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._buckets[key] = TokenBucket(self.burst, now)
+            return 0
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+        bucket.updated_at = now
+        return 0 if bucket.tokens >= 1 else (1 - bucket.tokens) / self.rate
+
+    def take(self, key: str | bytes) -> None:
+        """Take a token of the key's bucket, which wait_time() must have found non-empty."""
+        self._buckets[key].tokens -= 1
+
+    def discard(self, key: str | bytes) -> None:
+        """Drop the bucket of a key that will not be used anymore, such as the ID of a terminated session."""
+        self._buckets.pop(key, None)
+
+    def prune(self, now: float) -> None:
+        """Drop the buckets that refilled completely since they were last used."""
+        refill_secs = self.burst / self.rate
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if now - bucket.updated_at < refill_secs}
+        self._pruned_at = now
+
+    def prune_if_due(self, now: float) -> None:
+        """Prune the buckets if they were not pruned for PRUNE_INTERVAL_SECS."""
+        if now - self._pruned_at >= PRUNE_INTERVAL_SECS:
+            self.prune(now)
+
+
+class RequestRateLimiter:
+    """Rate limits of requests to /mcp per MCP session and per bearer token.
+
+    Session buckets are dropped when their session ends. Bearer tokens are only kept as digests. Buckets of
+    both kinds are also dropped once they refill completely, as a full bucket is the same as no bucket.
+
+    Attributes:
+        session_limit: Buckets keyed by MCP session ID
+        token_limit: Buckets keyed by a digest of the bearer token
+    """
+
+    def __init__(
+        self,
+        session_rate: float = RATE_LIMIT_SESSION_REQUESTS_PER_SEC,
+        session_burst: float = RATE_LIMIT_SESSION_BURST,
+        token_rate: float = RATE_LIMIT_TOKEN_REQUESTS_PER_SEC,
+        token_burst: float = RATE_LIMIT_TOKEN_BURST,
+    ) -> None:
+        """Initialize the rate limiter.
+
+        Args:
+            session_rate: Sustained number of requests per second allowed for an MCP session
+            session_burst: Number of requests an MCP session can send at once after being idle
+            token_rate: Sustained number of requests per second allowed for a bearer token
+            token_burst: Number of requests a bearer token can send at once after being idle
+        """
+        self.session_limit = RateLimit('session', session_rate, session_burst)
+        self.token_limit = RateLimit('token', token_rate, token_burst)
+
+    @property
+    def rejected(self) -> dict[str, int]:
+        """Number of rejected requests, by the kind of limit that rejected them."""
+        return {limit.name: limit.rejected for limit in (self.session_limit, self.token_limit)}
+
+    def check(self, session_id: str | None, authorization: str | None) -> tuple[str, float] | None:
+        """Count a request against its limits.
+
+        Returns:
+            None if the request is allowed, otherwise the name of the exhausted limit and the number
+            of seconds after which the request can be retried
+        """
+        now = time.monotonic()
+        self.session_limit.prune_if_due(now)
+        self.token_limit.prune_if_due(now)
+        checked: list[tuple[RateLimit, str | bytes]] = []
+        if authorization and authorization[:7].lower() == 'bearer ':
+            # Keep a digest of the token only, so that credentials are not held by the limiter
+            checked.append(
+                (self.token_limit, hashlib.blake2b(authorization[7:].strip().encode(), digest_size=16).digest())
+            )
+        if session_id:
+            checked.append((self.session_limit, session_id))
+        # Check every limit before taking any token, so that a rejected request is not charged to the others
+        for limit, key in checked:
+            if retry_after := limit.wait_time(key, now):
+                limit.rejected += 1
+                return limit.name, retry_after
+        for limit, key in checked:
+            limit.take(key)
+        return None
+
+    def discard_session(self, session_id: str) -> None:
+        """Drop the bucket of a terminated session."""
+        self.session_limit.discard(session_id)
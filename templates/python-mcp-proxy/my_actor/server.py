@@ -7,39 +7,85 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
+import functools
+import json
 import logging
+import math
 import time
 from typing import TYPE_CHECKING, Any
+from uuid import uuid4
 
-import httpx
 import uvicorn
-from mcp.client.session import ClientSession
 from mcp.client.sse import sse_client
 from mcp.client.stdio import StdioServerParameters, stdio_client
 from mcp.client.streamable_http import streamablehttp_client
+from mcp.server import Server
 from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+from mcp.types import INVALID_REQUEST
 from pydantic import ValidationError
 from starlette.applications import Starlette
 from starlette.middleware import Middleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
 from starlette.responses import JSONResponse, RedirectResponse, Response
 from starlette.routing import Mount, Route
 
-from .const import SESSION_TIMEOUT_SECS
-from .event_store import InMemoryEventStore
+from .admission import ToolAdmissionControl
+from .cache import ListResultCache, RemoteDocumentCache, ToolResultCache
+from .cancellation import CancellingClientSession, InFlightCalls
+from .charging import ChargeAggregator
+from .compression import CompressionMiddleware
+from .const import (
+    EVENT_STORE_COMPACTION_INTERVAL_SECS,
+    LIST_CACHE_TTL_SECS,
+    LIST_PAGE_SIZE,
+    PROGRESS_MAX_NOTIFICATIONS_PER_SEC,
+    SESSION_TIMEOUT_SECS,
+    TOOL_MAX_CONCURRENT_CALLS,
+    UPSTREAM_POOL_SIZE,
+)
+from .event_store import InMemoryEventStore, SessionEventStore, current_session_key
+from .file_event_store import FileEventStore
+from .hedging import HedgedSession, HedgePolicy
 from .mcp_gateway import create_gateway
-from .models import RemoteServerParameters, ServerParameters, ServerType
+from .metrics import METRICS_CONTENT_TYPE, ProxyMetrics
+from .models import RemoteServerParameters, ServerParameters, ServerType, UpstreamServer
+from .passthrough import RawPassthrough
+from .progress import ProgressThrottle
+from .session_reaper import SessionReaper
+from .single_flight import SingleFlight
+from .upstream_group import UpstreamGroup, namespace
+from .upstream_pool import PoolRouting, UpstreamPool
+from .validation import ToolArgumentValidator
 
 if TYPE_CHECKING:
     from collections.abc import AsyncIterator, Awaitable, Callable
 
-    from mcp.server import Server
+    from mcp.client.session import ClientSession
+    from mcp.client.streamable_http import GetSessionIdCallback
+    from mcp.server.streamable_http import EventStore
     from starlette import types as st
-    from starlette.types import Receive, Scope, Send
+    from starlette.requests import Request
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+    from .metrics import Samples
+    from .rate_limit import RequestRateLimiter
 
 logger = logging.getLogger('apify')
 
+OAUTH_AUTHORIZATION_SERVER_URL = 'https://api.apify.com/.well-known/oauth-authorization-server'
+# Bounds the pre-rendered HTML pages, as the host they are rendered for comes from the request
+HTML_PAGE_CACHE_SIZE = 64
+# Response of the root endpoint for non-browser clients, serialized once
+ROOT_RESPONSE_BODY = json.dumps(
+    {
+        'status': 'running',
+        'type': 'mcp-server',
+        'transport': 'streamable-http',
+        'endpoints': {
+            'streamableHttp': '/mcp',
+        },
+    }
+).encode()
+
 
 def is_html_browser(request: Request) -> bool:
     """Detect if the request is from an HTML browser based on Accept header."""
@@ -83,25 +129,67 @@ def get_html_page(server_name: str, mcp_url: str) -> str:
 </html>"""
 
 
+@functools.lru_cache(maxsize=HTML_PAGE_CACHE_SIZE)
+def render_html_page(server_name: str, mcp_url: str) -> bytes:
+    """Render the HTML page once per server URL (i.e. per host the page was requested on)."""
+    return get_html_page(server_name, mcp_url).encode()
+
+
 def serve_html_page(server_name: str, mcp_url: str) -> Response:
     """Serve HTML page for browser requests."""
-    html = get_html_page(server_name, mcp_url)
-    return Response(content=html, media_type='text/html')
+    return Response(content=render_html_page(server_name, mcp_url), media_type='text/html')
+
+
+def get_header(scope: Scope, name: bytes) -> str | None:
+    """Return the value of a request header from the raw ASGI scope; `name` must be lowercase."""
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
 
+async def read_body(receive: Receive) -> bytes:
+    """Read the complete body of an ASGI HTTP request."""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
 
-class McpPathRewriteMiddleware(BaseHTTPMiddleware):
+
+def replay_body(body: bytes, receive: Receive) -> Receive:
+    """Wrap the ASGI `receive` of a request whose body was already read, so that it returns the body again."""
+    replayed = False
+
+    async def _receive() -> Message:
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # Later messages (the disconnect of the client) come from the server
+        return await receive()
+
+    return _receive
+
+
+class McpPathRewriteMiddleware:
     """Add middleware to rewrite /mcp to /mcp/ to ensure consistent path handling.
 
     This is necessary so that Starlette does not return a 307 Temporary Redirect on the /mcp path,
     which would otherwise trigger the OAuth flow when the MCP server is deployed on the Apify platform.
+    It is a plain ASGI middleware, so it does not wrap requests or responses of the streamed /mcp endpoint.
     """
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Any:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Rewrite the request path."""
-        if request.url.path == '/mcp':
-            request.scope['path'] = '/mcp/'
-            request.scope['raw_path'] = b'/mcp/'
-        return await call_next(request)
+        if scope['type'] == 'http' and scope['path'] == '/mcp':
+            scope['path'] = '/mcp/'
+            scope['raw_path'] = b'/mcp/'
+        await self.app(scope, receive, send)
 
 
 class ProxyServer:
@@ -126,6 +214,23 @@ class ProxyServer:
         actor_charge_function: Callable[[str, int], Awaitable[Any]] | None = None,
         tool_whitelist: dict[str, tuple[str, int]] | None = None,
         session_timeout_secs: int = SESSION_TIMEOUT_SECS,
+        event_store: EventStore | None = None,
+        list_cache_ttl_secs: float = LIST_CACHE_TTL_SECS,
+        tool_result_cache: dict[str, tuple[float, bool]] | None = None,
+        upstream_pool_size: int = UPSTREAM_POOL_SIZE,
+        upstream_routing: PoolRouting = PoolRouting.LEAST_OUTSTANDING,
+        tool_concurrency_limits: dict[str, int] | None = None,
+        max_concurrent_tool_calls: int = TOOL_MAX_CONCURRENT_CALLS,
+        tool_timeouts: dict[str, float] | None = None,
+        *,
+        stateless: bool = False,
+        hedge_policy: HedgePolicy | None = None,
+        hedged_tools: set[str] | None = None,
+        rate_limiter: RequestRateLimiter | None = None,
+        raw_passthrough: bool = False,
+        list_page_size: int | None = LIST_PAGE_SIZE,
+        upstreams: list[UpstreamServer] | None = None,
+        max_progress_notifications_per_sec: float | None = PROGRESS_MAX_NOTIFICATIONS_PER_SEC,
     ) -> None:
         """Initialize the proxy server.
 
@@ -138,101 +243,359 @@ class ProxyServer:
             actor_charge_function: Optional function to charge for operations.
                            Should accept (event_name: str, count: int).
                            Typically, Actor.charge in Apify Actors.
+                           Charges are sent in batches in the background (see ChargeAggregator).
                            If None, no charging will occur.
             tool_whitelist: Optional dict mapping tool names to (event_name, default_count) tuples.
                            If provided, only whitelisted tools will be allowed and charged.
                            If None, all tools are allowed without specific charging.
             session_timeout_secs: Inactivity timeout in seconds before terminating idle sessions
+            event_store: Optional event store enabling clients to resume Streamable HTTP streams.
+                           Defaults to InMemoryEventStore; use FileEventStore to keep the events
+                           on disk instead of in memory.
+            list_cache_ttl_secs: Time in seconds for which list results (tools, prompts, resources)
+                           of the remote server are cached. Upstream list-changed notifications
+                           invalidate the cache earlier.
+            tool_result_cache: Optional dict mapping names of idempotent tools to (ttl_secs, charge_on_hit)
+                           tuples. Results of these tools are cached by their arguments.
+                           If None, no tool results are cached.
+            upstream_pool_size: Number of stdio server processes to start. With more than one, requests
+                           are load-balanced across a pool of processes (stdio servers only).
+            upstream_routing: How requests are routed to the pooled processes: to the process with
+                           the fewest requests in flight, or to the same process for a client session
+            tool_concurrency_limits: Optional dict mapping tool names to their maximum number of concurrent
+                           calls. Calls over the limit wait in a bounded queue and are rejected on timeout.
+            max_concurrent_tool_calls: Maximum number of concurrent calls of all tools together
+            tool_timeouts: Optional dict mapping tool names to deadlines of their calls in seconds. Calls
+                           over the deadline, and all calls of a closed client session, are stopped and
+                           cancelled at the MCP server.
+            stateless: Whether to serve /mcp without sessions: every request is handled on its own and
+                           answered with a plain JSON response. No sessions are tracked and no events
+                           are stored, so streams cannot be resumed and the server cannot send requests
+                           or notifications to clients outside of a response.
+            hedge_policy: Optional policy of hedged and retried requests to a remote (SSE or HTTP) server.
+                           It applies to list requests, reads, and calls of the tools in hedged_tools.
+                           If None, every request is sent once.
+            hedged_tools: Optional names of idempotent tools, safe to call more than once with the same
+                           arguments, whose calls are hedged and retried under hedge_policy. Calls of
+                           other tools are sent once.
+            rate_limiter: Optional token-bucket rate limits of requests to /mcp per MCP session and per
+                           bearer token. Requests over a limit are rejected with 429 Too Many Requests.
+                           If None, requests are not rate limited.
+            raw_passthrough: Whether to forward tool calls and resource reads to a Streamable HTTP server
+                           as raw bytes and relay its responses without parsing them (HTTP servers only).
+                           Calls of tools in tool_result_cache or hedged_tools are still served by
+                           the gateway.
+            list_page_size: Maximum number of items in a page of a list result (tools, prompts, resources);
+                           clients follow cursors to get the next pages. Larger pages of the MCP server are
+                           split. If None or 0, pages of the MCP server are served whole.
+            upstreams: Optional MCP servers (stdio, SSE, or HTTP) to serve together behind /mcp, instead of
+                           the server given by config and server_type. Tools and prompts are namespaced
+                           with the server name (`<name>__<tool>`, also in tool_whitelist and the other
+                           tool configurations), list requests are sent to all servers concurrently, and
+                           calls are routed to the server owning the tool. Raw passthrough and pools of
+                           stdio processes apply to a single server only.
+            max_progress_notifications_per_sec: Maximum rate of progress notifications forwarded per request.
+                           Notifications over the rate are coalesced, so that only the latest one is
+                           forwarded; the final one is always forwarded. If None, all are forwarded.
         """
         self.server_name = server_name
         self.server_type = server_type
+        self.stateless = stateless
         self.config = self._validate_config(self.server_type, config)
+        self.upstreams = [
+            upstream.model_copy(update={'config': self._validate_config(upstream.server_type, upstream.config)})
+            for upstream in upstreams or []
+        ]
         self.host: str = host
         self.port: int = port
         self.actor_charge_function = actor_charge_function
+        # Charges are recorded in memory and sent in batches in the background
+        self.charge_aggregator = ChargeAggregator(actor_charge_function) if actor_charge_function else None
         self.tool_whitelist = tool_whitelist
-        # Track per-session activity and timers for inactivity shutdown
-        self._session_last_activity: dict[str, float] = {}
-        self._session_timers: dict[str, asyncio.Task] = {}
-        # Inactivity window (seconds) before we terminate a session (DELETE)
-        self._session_timeout_secs: int = session_timeout_secs
+        self.event_store = event_store or InMemoryEventStore()
+        self.list_cache = ListResultCache(list_cache_ttl_secs)
+        self.oauth_metadata_cache = RemoteDocumentCache(OAUTH_AUTHORIZATION_SERVER_URL)
+        self.tool_result_cache = ToolResultCache(tool_result_cache) if tool_result_cache else None
+        # Limits concurrent tool calls; exposes per-limit queue depths and wait times
+        self.admission_control = ToolAdmissionControl(tool_concurrency_limits, max_concurrent_tool_calls)
+        # Coalesces concurrent identical upstream reads; exposes the number of coalesced calls
+        self.single_flight = SingleFlight()
+        # Validates tool call arguments against the input schemas of the tools, without an upstream round trip
+        self.argument_validator = ToolArgumentValidator()
+        # Stops tool calls at their deadline or when their session is closed; exposes counters of stopped calls
+        self.in_flight_calls = InFlightCalls(tool_timeouts)
+        # Latency histograms and in-flight counters served at /metrics
+        self.metrics = ProxyMetrics()
+        self.upstream_pool_size = upstream_pool_size
+        self.upstream_routing = upstream_routing
+        # Set when running a pool of stdio server processes; exposes per-process queue depths
+        self.upstream_pool: UpstreamPool | None = None
+        self.hedge_policy = hedge_policy
+        self.hedged_tools = hedged_tools or set()
+        # Rejects requests of sessions and bearer tokens sending too many; exposes rejection counters
+        self.rate_limiter = rate_limiter
+        self.raw_passthrough = raw_passthrough
+        self.list_page_size = list_page_size if list_page_size and list_page_size > 0 else None
+        # Coalesces progress notifications of tools reporting in a tight loop; exposes forwarded/dropped counters
+        self.progress_throttle = (
+            ProgressThrottle(max_progress_notifications_per_sec) if max_progress_notifications_per_sec else None
+        )
+        # Set when passing requests through to a Streamable HTTP server; exposes the number of forwarded requests
+        self.passthrough: RawPassthrough | None = None
+        # Set when serving several upstream servers; exposes the number of requests sent to each of them
+        self.upstream_group: UpstreamGroup | None = None
+        # Set when hedging requests to a remote server; exposes hedge and retry counters
+        self.hedged_session: HedgedSession | None = None
+        self._session_manager: StreamableHTTPSessionManager | None = None
+        # MCP session ID -> key of the session's streams in the event store
+        self._session_keys: dict[str, str] = {}
+        # Terminates sessions (DELETE) after the inactivity window; exposes live/expired session counters
+        self.session_reaper = SessionReaper(session_timeout_secs, self._terminate_session)
+        # Elapsed seconds from the start of `start` until each startup phase; exposed in the metrics
+        self.startup_timings: dict[str, float] = {}
+        self._startup_started_at = time.perf_counter()
+        self._gateway_ready = asyncio.Event()
+        self._shutdown = asyncio.Event()
+        self._uvicorn_server: uvicorn.Server | None = None
 
     @staticmethod
-    def _log_request(request: Request) -> None:
+    def _log_request(scope: Scope, session_id: str | None) -> None:
         """Log incoming MCP transport request for diagnostics."""
         logger.info(
             'MCP transport request',
             extra={
-                'method': request.method,
-                'path': str(request.url.path),
-                'mcp_session_id': request.headers.get('mcp-session-id'),
+                'method': scope['method'],
+                'path': scope['path'],
+                'mcp_session_id': session_id,
             },
         )
 
-    def _touch_session(self, session_id: str, session_manager: StreamableHTTPSessionManager) -> None:
-        """Record activity for a session and (re)schedule inactivity termination."""
-        self._session_last_activity[session_id] = time.time()
+    async def _terminate_session(self, session_id: str) -> None:
+        """Terminate a session by sending an internal DELETE request to the session manager."""
+        if self._session_manager is None:
+            return
 
-        # Cancel existing timer if present
-        timer = self._session_timers.get(session_id)
-        if timer and not timer.done():
-            timer.cancel()
+        # Craft an internal ASGI DELETE request to close the session
+        scope = {
+            'type': 'http',
+            'http_version': '1.1',
+            'method': 'DELETE',
+            'scheme': 'http',
+            'path': '/mcp/',
+            'raw_path': b'/mcp/',
+            'query_string': b'',
+            'headers': [
+                (b'mcp-session-id', session_id.encode('utf-8')),
+                (b'accept', b'application/json, text/event-stream'),
+            ],
+            'server': (self.host, self.port),
+            'client': ('127.0.0.1', 0),
+        }
 
-        async def _idle_close() -> None:
-            try:
-                await asyncio.sleep(self._session_timeout_secs)
-                # Verify that no new activity occurred during wait
-                last = self._session_last_activity.get(session_id, 0)
-                if time.time() - last < self._session_timeout_secs * 0.9:
-                    return  # Activity happened; skip
-                logger.info(f'Terminating idle MCP session {session_id}')
-
-                # Craft an internal ASGI DELETE request to close the session
-                scope = {
-                    'type': 'http',
-                    'http_version': '1.1',
-                    'method': 'DELETE',
-                    'scheme': 'http',
-                    'path': '/mcp/',
-                    'raw_path': b'/mcp/',
-                    'query_string': b'',
-                    'headers': [
-                        (b'mcp-session-id', session_id.encode('utf-8')),
-                        (b'accept', b'application/json, text/event-stream'),
-                    ],
-                    'server': (self.host, self.port),
-                    'client': ('127.0.0.1', 0),
-                }
+        async def _receive() -> dict[str, Any]:
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
 
-                async def _receive() -> dict[str, Any]:
-                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+        async def _send(_message: dict[str, Any]) -> None:
+            # Ignore internal response
+            return
 
-                async def _send(_message: dict[str, Any]) -> None:
-                    # Ignore internal response
-                    return
+        await self._session_manager.handle_request(scope, _receive, _send)  # ty: ignore[invalid-argument-type]
+        self._end_session(session_id)
 
-                await session_manager.handle_request(scope, _receive, _send)  # ty: ignore[invalid-argument-type]
-                self._cleanup_session_last_activity(session_id)
-                self._cleanup_session_timer(session_id)
-            except asyncio.CancelledError:
-                return
-            except Exception:
-                logger.exception('Failed to terminate idle session')
+    def _end_session(self, session_id: str) -> None:
+        """Stop tracking a terminated session and release its streams in the event store."""
+        self.session_reaper.discard(session_id)
+        if self.rate_limiter:
+            self.rate_limiter.discard_session(session_id)
+        session_key = self._session_keys.pop(session_id, None)
+        if not session_key:
+            return
+        # Results of calls still in flight can no longer be delivered, so the upstream work is stopped
+        if aborted := self.in_flight_calls.abort_session(session_key):
+            logger.info(f'Stopped {aborted} tool calls of closed session {session_id}')
+        if self.progress_throttle:
+            self.progress_throttle.discard_session(session_key)
+        if isinstance(self.event_store, SessionEventStore):
+            self.event_store.discard_session(session_key)
 
-        self._session_timers[session_id] = asyncio.create_task(_idle_close())
+    @staticmethod
+    def _rate_limited_response(limit_name: str, retry_after_secs: float) -> Response:
+        """Create the 429 response to a request over its rate limit, with a JSON-RPC error like the SDK's."""
+        return JSONResponse(
+            {
+                'jsonrpc': '2.0',
+                'id': 'server-error',
+                'error': {'code': INVALID_REQUEST, 'message': f'Too Many Requests: {limit_name} rate limit exceeded'},
+            },
+            status_code=429,
+            headers={'Retry-After': str(max(1, math.ceil(retry_after_secs)))},
+        )
 
-    def _cleanup_session_last_activity(self, session_id: str) -> None:
-        """Cleanup session tracking data."""
-        if session_id in self._session_last_activity:
-            del self._session_last_activity[session_id]
+    async def flush_charges(self, *, stop: bool = False) -> None:
+        """Send all pending charges to the charge function, e.g. before the Actor is aborted or migrated.
 
-    def _cleanup_session_timer(self, session_id: str) -> None:
-        """Cancel and cleanup session timer."""
-        if session_id in self._session_timers:
-            timer = self._session_timers[session_id]
-            if not timer.done():
-                timer.cancel()
-            del self._session_timers[session_id]
+        Args:
+            stop: Whether to also stop the background flushing, when the server is shutting down
+        """
+        if self.charge_aggregator is None:
+            return
+        if stop:
+            await self.charge_aggregator.stop()
+        else:
+            await self.charge_aggregator.flush()
+
+    def render_metrics(self) -> str:
+        """Render the proxy metrics, including the current state of its components, in the Prometheus text format."""
+        gauges: list[tuple[str, str, Samples]] = [
+            ('mcp_active_sessions', 'MCP sessions currently alive.', [({}, self.session_reaper.live_sessions)]),
+            (
+                'mcp_startup_phase_seconds',
+                'Time from the start of the proxy until each startup phase was reached.',
+                [({'phase': phase}, elapsed) for phase, elapsed in self.startup_timings.items()],
+            ),
+            (
+                'mcp_tool_call_queue_depth',
+                'Tool calls waiting for a free slot of a concurrency limit.',
+                [({'limit': name}, depth) for name, depth in self.admission_control.queue_depths.items()],
+            ),
+            (
+                'mcp_tool_call_slots_in_use',
+                'Tool calls holding a slot of a concurrency limit.',
+                [({'limit': limit.name}, limit.active) for limit in self.admission_control.limits],
+            ),
+            (
+                'mcp_tool_call_queue_wait_max_seconds',
+                'Longest time a tool call waited for a free slot of a concurrency limit.',
+                [({'limit': limit.name}, limit.max_wait_secs) for limit in self.admission_control.limits],
+            ),
+        ]
+        if not self.stateless and isinstance(self.event_store, InMemoryEventStore | FileEventStore):
+            gauges.append(
+                (
+                    'mcp_event_store_size_bytes',
+                    'Size of the events held by the event store.',
+                    [({}, self.event_store.size_bytes)],
+                )
+            )
+        counters: list[tuple[str, str, Samples]] = [
+            (
+                'mcp_tool_call_admissions_total',
+                'Tool calls admitted to a concurrency limit, and rejected as its queue was full or timed out.',
+                [
+                    sample
+                    for limit in self.admission_control.limits
+                    for sample in (
+                        ({'limit': limit.name, 'result': 'admitted'}, limit.admitted),
+                        ({'limit': limit.name, 'result': 'rejected'}, limit.rejected),
+                    )
+                ],
+            ),
+            (
+                'mcp_tool_call_queue_wait_seconds_total',
+                'Total time admitted tool calls waited for a free slot of a concurrency limit.',
+                [({'limit': limit.name}, limit.total_wait_secs) for limit in self.admission_control.limits],
+            ),
+        ]
+        counters.append(
+            (
+                'mcp_stopped_tool_calls_total',
+                'Tool calls stopped before they finished, by the reason.',
+                [
+                    ({'reason': 'timeout'}, self.in_flight_calls.timed_out),
+                    ({'reason': 'session_closed'}, self.in_flight_calls.aborted),
+                    ({'reason': 'cancelled'}, self.in_flight_calls.cancelled),
+                ],
+            )
+        )
+        cache_lookups: Samples = [
+            ({'cache': 'list', 'result': 'hit'}, self.list_cache.hits),
+            ({'cache': 'list', 'result': 'miss'}, self.list_cache.misses),
+        ]
+        if self.tool_result_cache:
+            cache_lookups.extend(
+                (
+                    ({'cache': 'tool_result', 'result': 'hit'}, self.tool_result_cache.hits),
+                    ({'cache': 'tool_result', 'result': 'miss'}, self.tool_result_cache.misses),
+                )
+            )
+        counters.append(
+            ('mcp_cache_lookups_total', 'Lookups of the list and tool result caches, by result.', cache_lookups)
+        )
+        if self.hedged_session:
+            counters.append(
+                (
+                    'mcp_upstream_hedged_requests_total',
+                    'Hedged and retried requests sent to the remote MCP server, and hedges that won.',
+                    [
+                        ({'kind': 'hedge'}, self.hedged_session.hedges),
+                        ({'kind': 'hedge_win'}, self.hedged_session.hedge_wins),
+                        ({'kind': 'retry'}, self.hedged_session.retries),
+                    ],
+                )
+            )
+        if self.progress_throttle:
+            counters.append(
+                (
+                    'mcp_progress_notifications_total',
+                    'Progress notifications forwarded, and dropped as a later one replaced them.',
+                    [
+                        ({'kind': 'forwarded'}, self.progress_throttle.forwarded),
+                        ({'kind': 'dropped'}, self.progress_throttle.dropped),
+                    ],
+                )
+            )
+        if self.upstream_group:
+            counters.append(
+                (
+                    'mcp_upstream_requests_total',
+                    'Requests sent to each of the upstream MCP servers.',
+                    [({'upstream': name}, count) for name, count in self.upstream_group.requests.items()],
+                )
+            )
+        if self.passthrough:
+            counters.append(
+                (
+                    'mcp_passthrough_requests_total',
+                    'Requests forwarded to the remote MCP server as raw bytes.',
+                    [({}, self.passthrough.forwarded)],
+                )
+            )
+        if self.rate_limiter:
+            counters.append(
+                (
+                    'mcp_rate_limited_requests_total',
+                    'Requests to /mcp rejected by a rate limit, by the kind of the limit.',
+                    [({'limit': name}, rejected) for name, rejected in self.rate_limiter.rejected.items()],
+                )
+            )
+        if self.charge_aggregator:
+            gauges.extend(
+                (
+                    (
+                        'mcp_charge_flush_lag_seconds',
+                        'Age of the oldest charge not sent to the platform yet.',
+                        [({}, self.charge_aggregator.flush_lag_secs)],
+                    ),
+                    (
+                        'mcp_charges_pending',
+                        'Charged events not sent to the platform yet.',
+                        [({}, self.charge_aggregator.pending.total())],
+                    ),
+                )
+            )
+        return self.metrics.render(gauges, counters)
+
+    async def _compact_event_store(self) -> None:
+        """Periodically reclaim event store streams that can no longer be resumed."""
+        if self.stateless or not isinstance(self.event_store, SessionEventStore):
+            return
+        while True:
+            await asyncio.sleep(EVENT_STORE_COMPACTION_INTERVAL_SECS)
+            try:
+                if reclaimed := self.event_store.compact():
+                    logger.debug(f'Event store compaction reclaimed {reclaimed} items')
+            except Exception:
+                logger.exception('Failed to compact event store')
 
     @staticmethod
     def _validate_config(client_type: ServerType, config: ServerParameters) -> ServerParameters | None:
@@ -255,57 +618,79 @@ class ProxyServer:
         """Create a send wrapper that captures session ID from response headers."""
 
         async def capturing_send(message: dict[str, Any]) -> None:
-            if message.get('type') == 'http.response.start':
-                headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in message.get('headers', [])}
-                if sid := headers.get('mcp-session-id'):
-                    session_id_from_resp['sid'] = sid
+            if message['type'] == 'http.response.start':
+                # Header names of ASGI messages are lowercase; the session manager sets them as such
+                for key, value in message.get('headers', ()):
+                    if key == b'mcp-session-id':
+                        session_id_from_resp['sid'] = value.decode('latin-1')
+                        break
             await send(message)
 
         return capturing_send
 
     @staticmethod
-    def _get_session_id_from_headers(headers: Any) -> str | None:
-        """Extract session ID from headers, trying both hyphen and underscore variants.
+    def _get_session_id_from_headers(scope: Scope) -> str | None:
+        """Extract session ID from the request headers, trying both hyphen and underscore variants.
 
-        HTTP headers are case-insensitive per spec, and Starlette's Request.headers
-        handles this automatically. We only need to check for hyphen vs underscore variants.
+        Header names in the ASGI scope are already lowercase, so only the hyphen and underscore
+        variants need to be checked. The headers are scanned once, preferring the hyphen variant.
 
         Args:
-            headers: Either a Starlette Request.headers object or a dict
+            scope: ASGI scope of the request
 
         Returns:
             Session ID string if found, None otherwise
         """
-        # Try both hyphen and underscore variants
-        # Case is handled automatically by Starlette's case-insensitive headers
-        for key in ('mcp-session-id', 'mcp_session_id'):
-            if value := headers.get(key):
-                return value
-        return None
-
-    async def create_starlette_app(self, mcp_server: Server) -> Starlette:
+        fallback = None
+        for key, value in scope['headers']:
+            if key == b'mcp-session-id' and value:
+                return value.decode('latin-1')
+            if key == b'mcp_session_id' and value:
+                fallback = value.decode('latin-1')
+        return fallback
+
+    async def create_starlette_app(self, mcp_server: Server) -> Starlette:  # noqa: PLR0915
         """Create a Starlette app that exposes /mcp endpoint for Streamable HTTP transport."""
-        event_store = InMemoryEventStore()
         session_manager = StreamableHTTPSessionManager(
             app=mcp_server,
-            event_store=event_store,  # Enable resume ability for Streamable HTTP connections
-            json_response=False,
+            # Enable resume ability for Streamable HTTP connections (not possible without sessions)
+            event_store=None if self.stateless else self.event_store,
+            json_response=self.stateless,
+            stateless=self.stateless,
         )
+        self._session_manager = session_manager
 
         @contextlib.asynccontextmanager
         async def lifespan(_app: Starlette) -> AsyncIterator[None]:
             """Context manager for managing session manager lifecycle."""
             async with session_manager.run():
                 logger.info('Application started with StreamableHTTP session manager!')
+                self._log_startup_phase('http_started')
+                if not self.stateless:
+                    self.session_reaper.start()
+                if self.charge_aggregator:
+                    self.charge_aggregator.start()
+                compaction_task = asyncio.create_task(self._compact_event_store())
                 try:
                     yield
                 finally:
                     logger.info('Application shutting down...')
+                    await self.session_reaper.stop()
+                    compaction_task.cancel()
+                    # Let the task end before the event store is closed, rather than leave it pending
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await compaction_task
+                    await self.flush_charges(stop=True)
+                    await self.oauth_metadata_cache.aclose()
+                    if isinstance(self.event_store, FileEventStore):
+                        await self.event_store.aclose()
 
         async def handle_root(request: Request) -> st.Response:
             """Handle root endpoint."""
-            # Handle Apify standby readiness probe
+            # Handle Apify standby readiness probe; the server is ready once the gateway is live
             if 'x-apify-container-server-readiness-probe' in request.headers:
+                if not self._gateway_ready.is_set():
+                    return Response(content=b'starting', media_type='text/plain', status_code=503)
                 return Response(
                     content=b'ok',
                     media_type='text/plain',
@@ -318,68 +703,107 @@ class ProxyServer:
                 mcp_url = f'{server_url}/mcp'
                 return serve_html_page(self.server_name, mcp_url)
 
-            return JSONResponse(
-                {
-                    'status': 'running',
-                    'type': 'mcp-server',
-                    'transport': 'streamable-http',
-                    'endpoints': {
-                        'streamableHttp': '/mcp',
-                    },
-                }
-            )
+            return Response(content=ROOT_RESPONSE_BODY, media_type='application/json')
+
+        async def handle_metrics(_request: Request) -> st.Response:
+            """Serve the proxy metrics in the Prometheus text exposition format."""
+            return Response(content=self.render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
         async def handle_favicon(_request: Request) -> st.Response:
             """Handle favicon.ico requests by redirecting to Apify's favicon."""
             return RedirectResponse(url='https://apify.com/favicon.ico', status_code=301)
 
-        async def handle_oauth_authorization_server(_request: Request) -> st.Response:
+        async def handle_oauth_authorization_server(request: Request) -> st.Response:
             """Handle OAuth authorization server well-known endpoint."""
             try:
                 # Some MCP clients do not follow redirects, so we need to fetch the data and return it directly.
-                async with httpx.AsyncClient() as client:
-                    response = await client.get('https://api.apify.com/.well-known/oauth-authorization-server')
-                    response.raise_for_status()
-                    data = response.json()
-                return JSONResponse(data, status_code=200)
+                # The data is cached and revalidated in the background, see RemoteDocumentCache.
+                document = await self.oauth_metadata_cache.get()
+                headers = {'ETag': document.etag, 'Cache-Control': f'max-age={int(self.oauth_metadata_cache.ttl_secs)}'}
+                if request.headers.get('if-none-match') == document.etag:
+                    return Response(status_code=304, headers=headers)
+                return Response(content=document.body, media_type='application/json', headers=headers)
             except Exception:
                 logger.exception('Error fetching OAuth authorization server data')
                 return JSONResponse({'error': 'Failed to fetch OAuth authorization server data'}, status_code=500)
 
         # ASGI handler for Streamable HTTP connections
         async def handle_streamable_http(scope: Scope, receive: Receive, send: Send) -> None:
+            # Work on the raw ASGI scope; no Request object is built on this hot path
+            req_sid = self._get_session_id_from_headers(scope)
+            self._log_request(scope, req_sid)
+
             # Check if this is a GET request from a browser
-            request = Request(scope, receive)
-            self._log_request(request)
-            if scope['method'] == 'GET' and is_html_browser(request):
-                server_url = f'https://{request.headers.get("host", "localhost")}'
+            if scope['method'] == 'GET' and 'text/html' in (get_header(scope, b'accept') or ''):
+                server_url = f'https://{get_header(scope, b"host") or "localhost"}'
                 mcp_url = f'{server_url}/mcp'
                 response = serve_html_page(self.server_name, mcp_url)
                 # Send the HTML response
                 await response(scope, receive, send)
                 return
 
+            # Reject requests over their rate limit before they reach the session manager; terminating
+            # a session is always allowed, as it frees resources
+            if self.rate_limiter and scope['method'] != 'DELETE':
+                rejection = self.rate_limiter.check(req_sid, get_header(scope, b'authorization'))
+                if rejection:
+                    response = self._rate_limited_response(*rejection)
+                    await response(scope, receive, send)
+                    return
+
+            # Tool calls and resource reads of live sessions may be forwarded to the remote server as raw bytes
+            if self.passthrough and scope['method'] == 'POST' and (self.stateless or req_sid in self._session_keys):
+                body = await read_body(receive)
+                if req_sid:
+                    self.session_reaper.touch(req_sid)
+                    current_session_key.set(self._session_keys.get(req_sid, ''))
+                if await self.passthrough.handle(body, send, req_sid):
+                    return
+                receive = replay_body(body, receive)
+
+            # Without sessions there is nothing to track, every request is handled on its own
+            if self.stateless:
+                await session_manager.handle_request(scope, receive, send)
+                return
+
+            # Scope event store streams to the session; a new key is assigned on initialization (no session ID)
+            session_key = self._session_keys.get(req_sid, '') if req_sid else uuid4().hex
+            current_session_key.set(session_key)
+
             if scope['method'] == 'DELETE':
                 await session_manager.handle_request(scope, receive, send)
-                if req_sid := self._get_session_id_from_headers(request.headers):
-                    self._cleanup_session_last_activity(req_sid)
-                    self._cleanup_session_timer(req_sid)
+                if req_sid:
+                    self._end_session(req_sid)
                 return
 
             # For non-browser requests or non-GET requests, delegate to session manager
-            # Wrap `send` to capture the session ID from response headers of initialization
+            # Touch existing session if present on request
+            if req_sid:
+                self.session_reaper.touch(req_sid)
+                await session_manager.handle_request(scope, receive, send)
+                return
+
+            # Initialization (no session id in request): wrap `send` to capture the session ID from response headers
             session_id_from_resp: dict[str, str | None] = {'sid': None}
             capturing_send = self._create_capturing_send(send, session_id_from_resp)
-
-            # Log and touch existing session if present on request
-            if req_sid := self._get_session_id_from_headers(request.headers):
-                self._touch_session(req_sid, session_manager)
-
             await session_manager.handle_request(scope, receive, capturing_send)  # ty: ignore[invalid-argument-type]
 
-            # If this was an initialization (no session id in request), capture from response and touch
-            if not req_sid and session_id_from_resp['sid']:
-                self._touch_session(session_id_from_resp['sid'], session_manager)
+            # Capture the new session from the response and touch it
+            if new_sid := session_id_from_resp['sid']:
+                self._session_keys[new_sid] = session_key
+                self.session_reaper.touch(new_sid)
+            elif isinstance(self.event_store, SessionEventStore):
+                self.event_store.discard_session(session_key)
+
+        async def handle_mcp(scope: Scope, receive: Receive, send: Send) -> None:
+            self.metrics.requests_in_flight += 1
+            try:
+                # Requests arriving before the upstream server is connected wait for the gateway
+                if not self._gateway_ready.is_set():
+                    await self._gateway_ready.wait()
+                await handle_streamable_http(scope, receive, send)
+            finally:
+                self.metrics.requests_in_flight -= 1
 
         return Starlette(
             debug=True,
@@ -391,51 +815,222 @@ class ProxyServer:
                     endpoint=handle_oauth_authorization_server,
                     methods=['GET'],
                 ),
-                Mount('/mcp/', app=handle_streamable_http),
+                Route('/metrics', endpoint=handle_metrics, methods=['GET']),
+                Mount('/mcp/', app=CompressionMiddleware(handle_mcp)),
             ],
             lifespan=lifespan,
             middleware=[Middleware(McpPathRewriteMiddleware)],
         )
 
+    async def _create_gateway(self, session: ClientSession | HedgedSession | UpstreamPool | UpstreamGroup) -> Server:
+        """Create the MCP gateway proxying requests through the given upstream client session."""
+        return await create_gateway(
+            session,
+            self.charge_aggregator.charge if self.charge_aggregator else None,
+            self.tool_whitelist,
+            list_cache=self.list_cache,
+            tool_result_cache=self.tool_result_cache,
+            single_flight=self.single_flight,
+            admission_control=self.admission_control,
+            metrics=self.metrics,
+            argument_validator=self.argument_validator,
+            in_flight_calls=self.in_flight_calls,
+            list_page_size=self.list_page_size,
+            progress_throttle=self.progress_throttle,
+        )
+
+    def _create_passthrough(
+        self, session: CancellingClientSession, get_upstream_session_id: GetSessionIdCallback
+    ) -> RawPassthrough:
+        """Create the raw passthrough of requests in the proxy's session with the Streamable HTTP server."""
+        return RawPassthrough(
+            RemoteServerParameters.model_validate(self.config),
+            get_upstream_session_id,
+            lambda: session.protocol_version,
+            self.charge_aggregator.charge if self.charge_aggregator else None,
+            self.tool_whitelist,
+            tool_result_cache=self.tool_result_cache,
+            admission_control=self.admission_control,
+            metrics=self.metrics,
+            argument_validator=self.argument_validator,
+            in_flight_calls=self.in_flight_calls,
+            progress_throttle=self.progress_throttle,
+            hedged_tools=self.hedged_tools if self.hedge_policy else None,
+        )
+
+    def _log_startup_phase(self, phase: str) -> None:
+        """Record and log the time from the start of `start` until the given startup phase was reached."""
+        elapsed = time.perf_counter() - self._startup_started_at
+        self.startup_timings[phase] = elapsed
+        logger.info(f'Startup phase {phase} reached after {elapsed:.3f}s')
+
     async def _run_server(self, app: Starlette) -> None:
         """Run the Starlette app with uvicorn."""
         config_ = uvicorn.Config(app, host=self.host, port=self.port, log_level='info', access_log=True)
         server = uvicorn.Server(config_)
+        self._uvicorn_server = server
         await server.serve()
 
-    async def start(self) -> None:
-        """Start Starlette app and connect to stdio, Streamable HTTP, or SSE based MCP server."""
-        logger.info(f'Starting MCP server with client type: {self.server_type} and config {self.config}')
+    async def _serve_remote_gateway(self, session: ClientSession) -> None:
+        """Serve the gateway of a remote server, hedging and retrying idempotent requests if configured."""
+        if self.hedge_policy is None:
+            await self._serve_gateway(session)
+            return
+        self.hedged_session = HedgedSession(session, self.hedge_policy, self.hedged_tools)
+        await self._serve_gateway(self.hedged_session)
+
+    async def _serve_gateway(self, session: ClientSession | HedgedSession | UpstreamPool | UpstreamGroup) -> None:
+        """Create the gateway, start serving it on /mcp, and keep the upstream connection open until shutdown."""
+        self._log_startup_phase('upstream_connected')
+        mcp_server = await self._create_gateway(session)
+        if self._session_manager is None:
+            raise RuntimeError('The Starlette app must be created before the gateway is served')
+        # No session exists yet, so all sessions are served by the gateway
+        self._session_manager.app = mcp_server
+        self._gateway_ready.set()
+        self._log_startup_phase('gateway_ready')
+        await self._shutdown.wait()
+
+    @contextlib.asynccontextmanager
+    async def _connect_upstream(self, upstream: UpstreamServer) -> AsyncIterator[ClientSession | HedgedSession]:
+        """Connect to one of several upstream servers and yield its client session, hedged if configured."""
+        params: dict = upstream.config.model_dump(exclude_unset=True)
+        match upstream.server_type:
+            case ServerType.STDIO:
+                transport = stdio_client(StdioServerParameters.model_validate(upstream.config))
+            case ServerType.SSE:
+                transport = sse_client(**params)
+            case ServerType.HTTP:
+                transport = streamablehttp_client(**params)
+        async with (
+            transport as (read_stream, write_stream, *_),
+            CancellingClientSession(
+                read_stream, write_stream, message_handler=self.list_cache.handle_upstream_message
+            ) as session,
+        ):
+            if upstream.server_type == ServerType.STDIO or self.hedge_policy is None:
+                yield session
+                return
+            # Hedged tools are configured by their namespaced names
+            prefix = namespace(upstream.name, '')
+            idempotent_tools = {
+                tool_name.removeprefix(prefix) for tool_name in self.hedged_tools if tool_name.startswith(prefix)
+            }
+            yield HedgedSession(session, self.hedge_policy, idempotent_tools)
+
+    async def _hold_upstream(self, upstream: UpstreamServer, connected: asyncio.Future) -> None:
+        """Connect to one of several upstream servers, resolve `connected` with its session and hold it until shutdown.
+
+        The connection is opened and closed in this task, as the cancel scopes of the transports require.
+        """
+        try:
+            async with self._connect_upstream(upstream) as session:
+                connected.set_result(session)
+                await self._shutdown.wait()
+        except asyncio.CancelledError:
+            connected.cancel()
+            raise
+        except Exception as e:
+            if not connected.done():
+                connected.set_exception(e)
+            raise
+
+    async def _run_upstream_group(self) -> None:
+        """Connect to all upstream servers concurrently and serve the gateway of their group until shutdown."""
+        loop = asyncio.get_running_loop()
+        connected = {upstream.name: loop.create_future() for upstream in self.upstreams}
+        tasks = [asyncio.create_task(self._hold_upstream(u, connected[u.name])) for u in self.upstreams]
+        try:
+            sessions = await asyncio.gather(*connected.values())
+            self.upstream_group = UpstreamGroup(self.server_name, dict(zip(connected, sessions, strict=True)))
+            # Serve until shutdown, or until the connection to one of the servers fails
+            serve_task = asyncio.create_task(self._serve_gateway(self.upstream_group))
+            tasks.append(serve_task)
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_upstream(self) -> None:
+        """Connect to stdio, Streamable HTTP, or SSE based MCP server and serve the gateway until shutdown."""
         params: dict = (self.config and self.config.model_dump(exclude_unset=True)) or {}
 
-        if self.server_type == ServerType.STDIO:
+        if self.upstreams:
+            await self._run_upstream_group()
+
+        elif self.server_type == ServerType.STDIO and self.upstream_pool_size > 1:
+            config_ = StdioServerParameters.model_validate(self.config)
+            async with UpstreamPool(
+                config_,
+                self.upstream_pool_size,
+                self.upstream_routing,
+                message_handler=self.list_cache.handle_upstream_message,
+            ) as pool:
+                self.upstream_pool = pool
+                await self._serve_gateway(pool)
+
+        elif self.server_type == ServerType.STDIO:
             # validate config again to prevent mypy errors
             config_ = StdioServerParameters.model_validate(self.config)
             async with (
                 stdio_client(config_) as (read_stream, write_stream),
-                ClientSession(read_stream, write_stream) as session,
+                CancellingClientSession(
+                    read_stream, write_stream, message_handler=self.list_cache.handle_upstream_message
+                ) as session,
             ):
-                mcp_server = await create_gateway(session, self.actor_charge_function, self.tool_whitelist)
-                app = await self.create_starlette_app(mcp_server)
-                await self._run_server(app)
+                await self._serve_gateway(session)
 
         elif self.server_type == ServerType.SSE:
             async with (
                 sse_client(**params) as (read_stream, write_stream),
-                ClientSession(read_stream, write_stream) as session,
+                CancellingClientSession(
+                    read_stream, write_stream, message_handler=self.list_cache.handle_upstream_message
+                ) as session,
             ):
-                mcp_server = await create_gateway(session, self.actor_charge_function, self.tool_whitelist)
-                app = await self.create_starlette_app(mcp_server)
-                await self._run_server(app)
+                await self._serve_remote_gateway(session)
 
         elif self.server_type == ServerType.HTTP:
             # HTTP streamable server needs to unpack three parameters
             async with (
-                streamablehttp_client(**params) as (read_stream, write_stream, _),
-                ClientSession(read_stream, write_stream) as session,
+                streamablehttp_client(**params) as (read_stream, write_stream, get_session_id),
+                CancellingClientSession(
+                    read_stream, write_stream, message_handler=self.list_cache.handle_upstream_message
+                ) as session,
             ):
-                mcp_server = await create_gateway(session, self.actor_charge_function, self.tool_whitelist)
-                app = await self.create_starlette_app(mcp_server)
-                await self._run_server(app)
+                if self.raw_passthrough:
+                    self.passthrough = self._create_passthrough(session, get_session_id)
+                try:
+                    await self._serve_remote_gateway(session)
+                finally:
+                    if self.passthrough:
+                        await self.passthrough.aclose()
         else:
             raise ValueError(f'Unknown server type: {self.server_type}')
+
+    async def start(self) -> None:
+        """Start Starlette app and connect to stdio, Streamable HTTP, or SSE based MCP server.
+
+        The HTTP server binds right away while the upstream server is connected concurrently. Until the gateway
+        is live, the readiness probe reports that the server is not ready and requests to /mcp wait for it.
+        """
+        logger.info(f'Starting MCP server with client type: {self.server_type} and config {self.config}')
+        self._startup_started_at = time.perf_counter()
+        # The placeholder server is replaced by the gateway once the upstream server is connected
+        app = await self.create_starlette_app(Server(self.server_name))
+
+        upstream_task = asyncio.create_task(self._run_upstream())
+        server_task = asyncio.create_task(self._run_server(app))
+        try:
+            # Whichever stops first (shutdown signal or a failed upstream connection) stops the other one
+            await asyncio.wait((upstream_task, server_task), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._shutdown.set()
+            if self._uvicorn_server is not None:
+                self._uvicorn_server.should_exit = True
+            await asyncio.wait((upstream_task, server_task))
+
+        for task in (upstream_task, server_task):
+            task.result()
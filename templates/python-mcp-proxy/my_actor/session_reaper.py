@@ -0,0 +1,109 @@
+"""Expiry of idle MCP sessions driven by a single background task.
+
+Recording activity for a session only updates a timestamp. Deadlines are kept in a min-heap which one
+background task drains: when a deadline is reached, the session is either expired or, if it was active
+in the meantime, re-queued with its new deadline. This keeps the per-request cost constant no matter
+how many sessions are alive.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import heapq
+import logging
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger('apify')
+
+
+class SessionReaper:
+    """Track session activity and expire sessions that stay idle for longer than the timeout.
+
+    Attributes:
+        timeout_secs: Inactivity window in seconds before a session is expired
+        expired_sessions: Number of sessions expired by the reaper since it was created
+    """
+
+    def __init__(self, timeout_secs: float, on_expire: Callable[[str], Awaitable[None]]) -> None:
+        """Initialize the reaper.
+
+        Args:
+            timeout_secs: Inactivity window in seconds before a session is expired
+            on_expire: Coroutine function called with the session ID of every expired session
+        """
+        self.timeout_secs = timeout_secs
+        self.expired_sessions = 0
+        self._on_expire = on_expire
+        # session_id -> monotonic timestamp of the last activity
+        self._last_activity: dict[str, float] = {}
+        # (deadline, session_id) entries; may be stale, they are re-validated when popped
+        self._deadlines: list[tuple[float, str]] = []
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def live_sessions(self) -> int:
+        """Number of sessions currently tracked by the reaper."""
+        return len(self._last_activity)
+
+    def touch(self, session_id: str) -> None:
+        """Record activity for a session, starting to track it if it is new."""
+        now = time.monotonic()
+        if session_id not in self._last_activity:
+            # All deadlines share the same timeout, so a new entry never precedes the current heap top
+            heapq.heappush(self._deadlines, (now + self.timeout_secs, session_id))
+            self._wakeup.set()
+        self._last_activity[session_id] = now
+
+    def discard(self, session_id: str) -> None:
+        """Stop tracking a session that was closed by other means (e.g. client DELETE)."""
+        self._last_activity.pop(session_id, None)
+
+    def start(self) -> None:
+        """Start the background reaper task."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background reaper task."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            if not self._deadlines:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            deadline, session_id = self._deadlines[0]
+            now = time.monotonic()
+            if deadline > now:
+                await asyncio.sleep(deadline - now)
+                continue
+
+            heapq.heappop(self._deadlines)
+            last_activity = self._last_activity.get(session_id)
+            if last_activity is None:
+                continue  # Session was discarded in the meantime
+
+            if (new_deadline := last_activity + self.timeout_secs) > now:
+                heapq.heappush(self._deadlines, (new_deadline, session_id))
+                continue
+
+            del self._last_activity[session_id]
+            self.expired_sessions += 1
+            logger.info(f'Terminating idle MCP session {session_id}')
+            try:
+                await self._on_expire(session_id)
+            except Exception:
+                logger.exception('Failed to terminate idle session')
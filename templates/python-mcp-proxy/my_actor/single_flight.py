@@ -0,0 +1,52 @@
+"""Coalescing of concurrent identical requests to the upstream MCP server.
+
+When many clients connect at once (e.g. after a Standby cold start), they send the same list and read
+requests at the same time. The first request for a key starts the upstream call; identical requests
+arriving while it is in flight wait for the same call instead of sending their own.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any, TypeVar
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Hashable
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """Share a single in-flight call among concurrent callers using the same key.
+
+    The shared call runs in its own task, so a caller that gets cancelled (e.g. because its client
+    disconnected) does not cancel the call for the other callers.
+
+    Attributes:
+        calls: Number of calls actually started
+        coalesced: Number of calls that joined a call already in flight instead of starting their own
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: dict[Hashable, asyncio.Future[Any]] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return the result of `fn()`, sharing it with concurrent callers using the same key."""
+        future = self._in_flight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(fn())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future[Any]) -> None:
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        # Mark the exception as retrieved, in case all callers were cancelled
+        if not future.cancelled():
+            future.exception()
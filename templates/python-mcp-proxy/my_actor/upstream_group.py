@@ -0,0 +1,314 @@
+"""Group of MCP servers that the gateway serves behind a single endpoint, in place of a single client session.
+
+Each server of the group is mounted under its name: tools and prompts are namespaced as
+`<name>__<tool>`, so that equally named tools of different servers do not collide, and calls are routed
+to the server owning the tool. List requests are sent to all servers concurrently and their results are
+merged; a cursor of a merged list holds the cursors of the servers that have more pages. Resource reads are
+routed to the server listing the resource, or a resource template matching its URI.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import re
+from typing import TYPE_CHECKING, Any
+
+from mcp import types
+from mcp.shared.exceptions import McpError
+
+from .const import UPSTREAM_NAMESPACE_SEPARATOR
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from mcp.client.session import ClientSession
+    from pydantic import AnyUrl
+
+    from .hedging import HedgedSession
+
+logger = logging.getLogger('apify')
+
+
+def namespace(member_name: str, name: str) -> str:
+    """Return the name of a server's tool or prompt as served by the group."""
+    return f'{member_name}{UPSTREAM_NAMESPACE_SEPARATOR}{name}'
+
+
+def template_pattern(uri_template: str) -> re.Pattern[str]:
+    """Compile a pattern matching the URIs expanded from an RFC 6570 URI template.
+
+    A simple `{var}` expression matches a single path segment; expressions with an operator (such as
+    `{+path}` or `{?query}`) may match anything, including nothing.
+    """
+    parts = re.split(r'(\{[^}]*\})', uri_template)
+    return re.compile(
+        ''.join(
+            re.escape(part) if i % 2 == 0 else ('[^/?#]+' if part[1:2].isalnum() or part[1:2] == '_' else '.*')
+            for i, part in enumerate(parts)
+        )
+    )
+
+
+def _invalid_params(message: str) -> McpError:
+    return McpError(types.ErrorData(code=types.INVALID_PARAMS, message=message))
+
+
+class UpstreamGroup:
+    """Group of named MCP servers exposing the subset of the `ClientSession` API used by the gateway.
+
+    Attributes:
+        name: Name of the server reported by the group on initialization
+        members: Client sessions of the servers, by the name the server is mounted under
+        requests: Number of requests sent to every server, by server name
+    """
+
+    def __init__(self, name: str, members: dict[str, ClientSession | HedgedSession]) -> None:
+        """Initialize the group.
+
+        Args:
+            name: Name of the server reported by the group on initialization
+            members: Client sessions of the servers, by the name the server is mounted under; names must
+                not contain UPSTREAM_NAMESPACE_SEPARATOR
+        """
+        for member_name in members:
+            if not member_name or UPSTREAM_NAMESPACE_SEPARATOR in member_name:
+                raise ValueError(f'Invalid upstream server name: {member_name!r}')
+        self.name = name
+        self.members = members
+        self.requests = dict.fromkeys(members, 0)
+        self._capabilities: dict[str, types.ServerCapabilities] = {}
+        # Resource URIs and URI templates -> name of the server listing them, for routing reads to their owner
+        self._resource_owners: dict[str, str] = {}
+        # URI templates -> pattern matching the URIs expanded from them
+        self._template_patterns: dict[str, re.Pattern[str]] = {}
+
+    async def initialize(self) -> types.InitializeResult:
+        """Initialize all servers concurrently and return their merged capabilities."""
+        results = dict(
+            zip(self.members, await asyncio.gather(*(m.initialize() for m in self.members.values())), strict=True)
+        )
+        self._capabilities = {member_name: result.capabilities for member_name, result in results.items()}
+        logger.info(f'Initialized {len(results)} upstream MCP servers: {", ".join(results)}')
+
+        def merged(capability: str) -> Any:
+            # The group has a capability if any of its servers has it; sub-capabilities (such as listChanged)
+            # are only claimed if all servers having the capability claim them
+            values = [v for r in results.values() if (v := getattr(r.capabilities, capability)) is not None]
+            if not values:
+                return None
+            fields = {key: all(getattr(v, key, None) for v in values) for key in type(values[0]).model_fields}
+            return type(values[0])(**fields)
+
+        capabilities = types.ServerCapabilities(
+            tools=merged('tools'),
+            prompts=merged('prompts'),
+            resources=merged('resources'),
+            logging=types.LoggingCapability() if any(r.capabilities.logging for r in results.values()) else None,
+            completions=(
+                types.CompletionsCapability() if any(r.capabilities.completions for r in results.values()) else None
+            ),
+        )
+        instructions = '\n\n'.join(
+            f'{namespace(member_name, "*")}: {result.instructions}'
+            for member_name, result in results.items()
+            if result.instructions
+        )
+        return types.InitializeResult(
+            protocolVersion=min(result.protocolVersion for result in results.values()),
+            capabilities=capabilities,
+            serverInfo=types.Implementation(name=self.name, version='1.0.0'),
+            instructions=instructions or None,
+        )
+
+    async def list_tools(self, params: types.PaginatedRequestParams | None = None) -> types.ListToolsResult:
+        """List the tools of all servers concurrently, namespaced with the name of their server."""
+        pages, next_cursor = await self._fan_out_list('tools', params, lambda m, p: m.list_tools(params=p))
+        tools = [
+            tool.model_copy(update={'name': namespace(member_name, tool.name)})
+            for member_name, page in pages.items()
+            for tool in page.tools
+        ]
+        return types.ListToolsResult(tools=tools, nextCursor=next_cursor)
+
+    async def call_tool(self, name: str, *args: Any, **kwargs: Any) -> types.CallToolResult:
+        """Call the tool on the server owning it."""
+        member_name, tool_name = self._split(name, 'tool')
+        return await self._send(member_name, lambda m: m.call_tool(tool_name, *args, **kwargs))
+
+    async def list_prompts(self, params: types.PaginatedRequestParams | None = None) -> types.ListPromptsResult:
+        """List the prompts of all servers concurrently, namespaced with the name of their server."""
+        pages, next_cursor = await self._fan_out_list('prompts', params, lambda m, p: m.list_prompts(params=p))
+        prompts = [
+            prompt.model_copy(update={'name': namespace(member_name, prompt.name)})
+            for member_name, page in pages.items()
+            for prompt in page.prompts
+        ]
+        return types.ListPromptsResult(prompts=prompts, nextCursor=next_cursor)
+
+    async def get_prompt(self, name: str, *args: Any, **kwargs: Any) -> types.GetPromptResult:
+        """Get the prompt from the server owning it."""
+        member_name, prompt_name = self._split(name, 'prompt')
+        return await self._send(member_name, lambda m: m.get_prompt(prompt_name, *args, **kwargs))
+
+    async def list_resources(self, params: types.PaginatedRequestParams | None = None) -> types.ListResourcesResult:
+        """List the resources of all servers concurrently."""
+        pages, next_cursor = await self._fan_out_list('resources', params, lambda m, p: m.list_resources(params=p))
+        resources = []
+        for member_name, page in pages.items():
+            for resource in page.resources:
+                self._resource_owners[str(resource.uri)] = member_name
+                resources.append(resource)
+        return types.ListResourcesResult(resources=resources, nextCursor=next_cursor)
+
+    async def list_resource_templates(
+        self, params: types.PaginatedRequestParams | None = None
+    ) -> types.ListResourceTemplatesResult:
+        """List the resource templates of all servers concurrently."""
+        pages, next_cursor = await self._fan_out_list(
+            'resources', params, lambda m, p: m.list_resource_templates(params=p)
+        )
+        templates = []
+        for member_name, page in pages.items():
+            for template in page.resourceTemplates:
+                self._resource_owners[template.uriTemplate] = member_name
+                self._template_patterns[template.uriTemplate] = template_pattern(template.uriTemplate)
+                templates.append(template)
+        return types.ListResourceTemplatesResult(resourceTemplates=templates, nextCursor=next_cursor)
+
+    async def read_resource(self, uri: AnyUrl) -> types.ReadResourceResult:
+        """Read the resource from the server listing it or a template matching it.
+
+        A resource that no server lists is read from the servers one after another, until one has it.
+        """
+        if (member_name := self._resource_owner(str(uri))) is not None:
+            return await self._send(member_name, lambda m: m.read_resource(uri))
+        return await self._first_success('resources', lambda m: m.read_resource(uri))
+
+    async def subscribe_resource(self, uri: AnyUrl) -> types.EmptyResult:
+        """Subscribe to resource updates on the server listing the resource, or on all servers."""
+        return await self._on_owner_or_all(str(uri), lambda m: m.subscribe_resource(uri))
+
+    async def unsubscribe_resource(self, uri: AnyUrl) -> types.EmptyResult:
+        """Unsubscribe from resource updates on the server listing the resource, or on all servers."""
+        return await self._on_owner_or_all(str(uri), lambda m: m.unsubscribe_resource(uri))
+
+    async def set_logging_level(self, level: types.LoggingLevel) -> types.EmptyResult:
+        """Set the logging level on all servers supporting logging."""
+        member_names = self._members_with('logging')
+        await asyncio.gather(*(self._send(n, lambda m: m.set_logging_level(level)) for n in member_names))
+        return types.EmptyResult()
+
+    async def send_progress_notification(self, *args: Any, **kwargs: Any) -> None:
+        """Forward a progress notification to all servers; those not knowing its token ignore it."""
+        await asyncio.gather(
+            *(self._send(n, lambda m: m.send_progress_notification(*args, **kwargs)) for n in self.members)
+        )
+
+    async def complete(
+        self, ref: types.ResourceTemplateReference | types.PromptReference, argument: dict[str, str]
+    ) -> types.CompleteResult:
+        """Send a completion/complete request to the server owning the referenced prompt or resource template."""
+        if isinstance(ref, types.PromptReference):
+            member_name, prompt_name = self._split(ref.name, 'prompt')
+            prompt_ref = ref.model_copy(update={'name': prompt_name})
+            return await self._send(member_name, lambda m: m.complete(prompt_ref, argument))
+        if (member_name := self._resource_owners.get(ref.uri)) is None:
+            raise _invalid_params(f'Unknown resource template: {ref.uri}')
+        return await self._send(member_name, lambda m: m.complete(ref, argument))
+
+    def _split(self, name: str, kind: str) -> tuple[str, str]:
+        """Split a namespaced name into the name of the server and the name of the tool or prompt."""
+        member_name, separator, member_item_name = name.partition(UPSTREAM_NAMESPACE_SEPARATOR)
+        if not separator or member_name not in self.members:
+            raise _invalid_params(f'Unknown {kind}: {name}')
+        return member_name, member_item_name
+
+    def _members_with(self, capability: str) -> list[str]:
+        return [name for name in self.members if getattr(self._capabilities.get(name), capability, None) is not None]
+
+    async def _send(self, member_name: str, call: Callable[[Any], Awaitable[Any]]) -> Any:
+        self.requests[member_name] += 1
+        return await call(self.members[member_name])
+
+    async def _fan_out_list(
+        self,
+        capability: str,
+        params: types.PaginatedRequestParams | None,
+        list_page: Callable[[Any, types.PaginatedRequestParams | None], Awaitable[Any]],
+    ) -> tuple[dict[str, Any], str | None]:
+        """List a page of every server concurrently; return the pages by server and the cursor of the next pages.
+
+        If any server fails to list, the request fails: a partial list would be cached by the gateway and would
+        replace the tools known to the argument validator.
+        """
+        if params is None or params.cursor is None:
+            cursors: dict[str, str | None] = dict.fromkeys(self._members_with(capability))
+        else:
+            cursors = self._decode_cursor(params.cursor)
+
+        async def _list(member_name: str, cursor: str | None) -> Any:
+            page_params = None if cursor is None else types.PaginatedRequestParams(cursor=cursor)
+            return await self._send(member_name, lambda m: list_page(m, page_params))
+
+        results = await asyncio.gather(*(_list(n, c) for n, c in cursors.items()), return_exceptions=True)
+        pages: dict[str, Any] = {}
+        errors: list[BaseException] = []
+        for member_name, result in zip(cursors, results, strict=True):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to list {capability} of upstream server '{member_name}': {result!r}")
+                errors.append(result)
+            else:
+                pages[member_name] = result
+        if errors:
+            raise errors[0]
+
+        next_cursors = {n: page.nextCursor for n, page in pages.items() if page.nextCursor is not None}
+        return pages, self._encode_cursor(next_cursors) if next_cursors else None
+
+    @staticmethod
+    def _encode_cursor(cursors: dict[str, str]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(cursors, separators=(',', ':')).encode()).decode()
+
+    def _decode_cursor(self, cursor: str) -> dict[str, str | None]:
+        try:
+            cursors = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, ValueError) as e:
+            raise _invalid_params(f'Invalid cursor: {cursor}') from e
+        if not isinstance(cursors, dict) or not all(
+            name in self.members and isinstance(c, str) for name, c in cursors.items()
+        ):
+            raise _invalid_params(f'Invalid cursor: {cursor}')
+        return cursors
+
+    def _resource_owner(self, uri: str) -> str | None:
+        """Return the name of the server listing the resource, or a resource template matching its URI."""
+        if (member_name := self._resource_owners.get(uri)) is not None:
+            return member_name
+        for uri_template, pattern in self._template_patterns.items():
+            if pattern.fullmatch(uri):
+                return self._resource_owners[uri_template]
+        return None
+
+    async def _first_success(self, capability: str, call: Callable[[Any], Awaitable[Any]]) -> Any:
+        """Send the request to the servers with the capability one after another and return the first success.
+
+        The servers are tried in turn rather than all at once, so that the request has no effect on servers
+        after the one that handles it.
+        """
+        error: BaseException | None = None
+        for member_name in self._members_with(capability):
+            try:
+                return await self._send(member_name, call)
+            except Exception as e:
+                error = error or e
+        raise error or _invalid_params('No upstream server provides resources')
+
+    async def _on_owner_or_all(self, uri: str, call: Callable[[Any], Awaitable[Any]]) -> types.EmptyResult:
+        if (member_name := self._resource_owner(uri)) is not None:
+            return await self._send(member_name, call)
+        await asyncio.gather(*(self._send(n, call) for n in self._members_with('resources')))
+        return types.EmptyResult()
@@ -0,0 +1,344 @@
+"""Pool of stdio MCP server processes that the gateway can use in place of a single client session.
+
+A single-threaded stdio MCP server handles one slow call at a time, stalling every other client. The pool
+starts several processes of the same server, routes every request to one of them and restarts processes
+that crash or stop answering health-check pings.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import weakref
+from enum import StrEnum
+from typing import TYPE_CHECKING, Any, Self
+
+import anyio
+from mcp.client.stdio import StdioServerParameters, stdio_client
+from mcp.server.lowlevel.server import request_ctx
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+from .cancellation import CancellingClientSession
+from .const import UPSTREAM_HEALTH_CHECK_INTERVAL_SECS, UPSTREAM_POOL_READY_TIMEOUT_SECS
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from mcp import types
+    from mcp.client.session import ClientSession, MessageHandlerFnT
+    from mcp.shared.session import RequestResponder
+    from pydantic import AnyUrl
+
+logger = logging.getLogger('apify')
+
+MAX_RESTART_DELAY_SECS = 30
+# Number of progress tokens of requests sent by the workers that are remembered to route progress back to them
+MAX_TRACKED_PROGRESS_TOKENS = 1000
+# Errors meaning that the connection to the worker process is broken and the worker must be restarted
+CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream)
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """Return whether the error means that the connection to the worker process is broken."""
+    if isinstance(error, McpError):
+        return error.error.code == CONNECTION_CLOSED
+    return isinstance(error, CONNECTION_ERRORS)
+
+
+class PoolRouting(StrEnum):
+    """Strategy for choosing the worker that handles a request."""
+
+    LEAST_OUTSTANDING = 'least-outstanding'  # Worker with the fewest requests in flight
+    SESSION_AFFINITY = 'session-affinity'  # Same worker for all requests of a client session
+
+
+class UpstreamWorker:
+    """A single upstream server process with its client session.
+
+    Attributes:
+        index: Position of the worker in the pool
+        outstanding: Number of requests currently in flight (queue depth of the worker)
+        restarts: Number of times the worker process was restarted
+    """
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.outstanding = 0
+        self.restarts = 0
+        self.session: ClientSession | None = None
+        self.initialize_result: types.InitializeResult | None = None
+        self.ready = asyncio.Event()
+        self.restart_requested = asyncio.Event()
+
+
+class UpstreamPool:
+    """Pool of stdio MCP server processes exposing the subset of the `ClientSession` API used by the gateway.
+
+    Use as an async context manager; entering it starts the worker processes and waits until all of
+    them are initialized.
+    """
+
+    def __init__(
+        self,
+        params: StdioServerParameters,
+        size: int,
+        routing: PoolRouting = PoolRouting.LEAST_OUTSTANDING,
+        message_handler: MessageHandlerFnT | None = None,
+    ) -> None:
+        """Initialize the pool.
+
+        Args:
+            params: Parameters of the stdio MCP server started by every worker
+            size: Number of worker processes
+            routing: Strategy for choosing the worker that handles a request
+            message_handler: Optional handler of messages sent by the upstream servers
+        """
+        self.params = params
+        self.routing = routing
+        self.message_handler = message_handler
+        self.workers = [UpstreamWorker(index) for index in range(size)]
+        self._tasks: list[asyncio.Task] = []
+        self._closing = False
+        # Notified whenever a worker enters or leaves rotation
+        self._ready_changed = asyncio.Condition()
+        # Downstream server session -> worker serving it (for PoolRouting.SESSION_AFFINITY)
+        self._affinity: weakref.WeakKeyDictionary[Any, UpstreamWorker] = weakref.WeakKeyDictionary()
+        # Progress token of a request sent by a worker -> that worker, which is the one expecting the progress
+        self._progress_owners: dict[types.ProgressToken, UpstreamWorker] = {}
+
+    @property
+    def queue_depths(self) -> list[int]:
+        """Number of requests in flight per worker."""
+        return [worker.outstanding for worker in self.workers]
+
+    async def __aenter__(self) -> Self:
+        """Start the worker processes and wait until all of them are initialized.
+
+        Raises:
+            RuntimeError: If a worker is not initialized within UPSTREAM_POOL_READY_TIMEOUT_SECS or its task exits
+        """
+        self._tasks = [asyncio.create_task(self._run_worker(worker)) for worker in self.workers]
+        all_ready = asyncio.gather(*(worker.ready.wait() for worker in self.workers))
+        # Workers retry failed starts forever, so a server that never starts has to be caught by the timeout
+        not_ready = [worker.index for worker in self.workers]
+        try:
+            await asyncio.wait(
+                [all_ready, *self._tasks], timeout=UPSTREAM_POOL_READY_TIMEOUT_SECS, return_when=asyncio.FIRST_COMPLETED
+            )
+            not_ready = [worker.index for worker in self.workers if not worker.ready.is_set()]
+        finally:
+            if not_ready:
+                all_ready.cancel()
+                await self.__aexit__()
+        if not_ready:
+            raise RuntimeError(f'Upstream workers {not_ready} failed to start')
+        logger.info(f'Started pool of {len(self.workers)} upstream MCP server processes')
+        return self
+
+    async def __aexit__(self, *_exc: object) -> None:
+        """Stop all worker processes."""
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run_worker(self, worker: UpstreamWorker) -> None:
+        """Run a worker process, restarting it whenever it crashes or stops answering pings."""
+        failures = 0
+        while True:
+            try:
+                async with (
+                    stdio_client(self.params) as (read_stream, write_stream),
+                    CancellingClientSession(
+                        read_stream, write_stream, message_handler=self._worker_message_handler(worker)
+                    ) as session,
+                ):
+                    worker.initialize_result = await session.initialize()
+                    worker.session = session
+                    worker.restart_requested.clear()
+                    await self._set_ready(worker, ready=True)
+                    failures = 0
+                    await self._supervise(worker, session)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f'Upstream worker {worker.index} failed')
+
+            await self._set_ready(worker, ready=False)
+            worker.session = None
+            # Requests of the old process are gone, so progress of them must not be routed to the new one
+            self._progress_owners = {t: w for t, w in self._progress_owners.items() if w is not worker}
+            # Cancellation may be absorbed by the cancel scopes of the stdio client
+            if self._closing:
+                return
+            worker.restarts += 1
+            failures += 1
+            delay = min(2 ** (failures - 1), MAX_RESTART_DELAY_SECS)
+            logger.warning(f'Restarting upstream worker {worker.index} in {delay}s')
+            await asyncio.sleep(delay)
+
+    def _worker_message_handler(self, worker: UpstreamWorker) -> MessageHandlerFnT:
+        """Return a message handler remembering the progress tokens of requests sent by the worker."""
+
+        async def handle(
+            message: RequestResponder[types.ServerRequest, types.ClientResult] | types.ServerNotification | Exception,
+        ) -> None:
+            params = getattr(getattr(message, 'request', None), 'root', None)
+            meta = getattr(getattr(params, 'params', None), 'meta', None)
+            if meta is not None and meta.progressToken is not None:
+                if len(self._progress_owners) >= MAX_TRACKED_PROGRESS_TOKENS:
+                    del self._progress_owners[next(iter(self._progress_owners))]
+                self._progress_owners[meta.progressToken] = worker
+            if self.message_handler is not None:
+                await self.message_handler(message)
+
+        return handle
+
+    @staticmethod
+    async def _supervise(worker: UpstreamWorker, session: ClientSession) -> None:
+        """Return once the worker needs to be restarted."""
+        while True:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(worker.restart_requested.wait(), UPSTREAM_HEALTH_CHECK_INTERVAL_SECS)
+                return
+            try:
+                await asyncio.wait_for(session.send_ping(), UPSTREAM_HEALTH_CHECK_INTERVAL_SECS)
+            except Exception as e:
+                if isinstance(e, TimeoutError) or is_connection_error(e):
+                    logger.warning(f'Upstream worker {worker.index} did not answer the health check')
+                    return
+                raise
+
+    async def _set_ready(self, worker: UpstreamWorker, *, ready: bool) -> None:
+        """Put the worker into rotation or take it out, waking up requests waiting for a ready worker."""
+        if ready:
+            worker.ready.set()
+        else:
+            worker.ready.clear()
+        async with self._ready_changed:
+            self._ready_changed.notify_all()
+
+    async def _wait_ready(self) -> list[UpstreamWorker]:
+        """Return the workers in rotation, waiting until there is at least one."""
+        async with self._ready_changed:
+            await self._ready_changed.wait_for(lambda: any(worker.ready.is_set() for worker in self.workers))
+        return [worker for worker in self.workers if worker.ready.is_set()]
+
+    async def _pick_worker(self) -> UpstreamWorker:
+        ready = await self._wait_ready()
+
+        if self.routing == PoolRouting.SESSION_AFFINITY and (ctx := request_ctx.get(None)) is not None:
+            worker = self._affinity.get(ctx.session)
+            if worker is None or not worker.ready.is_set():
+                worker = self._affinity[ctx.session] = min(ready, key=lambda w: w.outstanding)
+            return worker
+
+        return min(ready, key=lambda w: w.outstanding)
+
+    async def _dispatch(self, call: Callable[[ClientSession], Awaitable[Any]]) -> Any:
+        for attempt in range(len(self.workers)):
+            worker = await self._pick_worker()
+            session = worker.session
+            if session is None:
+                raise RuntimeError(f'Upstream worker {worker.index} is not connected')
+            worker.outstanding += 1
+            try:
+                return await call(session)
+            except Exception as e:
+                if not is_connection_error(e):
+                    raise
+                # Take the worker out of rotation right away; its supervisor restarts it
+                await self._set_ready(worker, ready=False)
+                worker.restart_requested.set()
+                # Requests that could not even be written to a closed stream are safe to retry elsewhere
+                if not isinstance(e, CONNECTION_ERRORS) or attempt == len(self.workers) - 1:
+                    raise
+                logger.warning(f'Upstream worker {worker.index} is disconnected, retrying on another worker')
+            finally:
+                worker.outstanding -= 1
+        raise AssertionError('unreachable')
+
+    async def initialize(self) -> types.InitializeResult:
+        """Return the initialization result of the first worker; workers are initialized when started."""
+        await self._wait_ready()
+        result = next(worker.initialize_result for worker in self.workers if worker.initialize_result)
+        assert result is not None  # noqa: S101
+        return result
+
+    async def list_tools(self, *args: Any, **kwargs: Any) -> types.ListToolsResult:
+        """Send a tools/list request to a worker."""
+        return await self._dispatch(lambda session: session.list_tools(*args, **kwargs))
+
+    async def call_tool(self, *args: Any, **kwargs: Any) -> types.CallToolResult:
+        """Send a tools/call request to a worker."""
+        return await self._dispatch(lambda session: session.call_tool(*args, **kwargs))
+
+    async def list_prompts(self, *args: Any, **kwargs: Any) -> types.ListPromptsResult:
+        """Send a prompts/list request to a worker."""
+        return await self._dispatch(lambda session: session.list_prompts(*args, **kwargs))
+
+    async def get_prompt(self, *args: Any, **kwargs: Any) -> types.GetPromptResult:
+        """Send a prompts/get request to a worker."""
+        return await self._dispatch(lambda session: session.get_prompt(*args, **kwargs))
+
+    async def list_resources(self, *args: Any, **kwargs: Any) -> types.ListResourcesResult:
+        """Send a resources/list request to a worker."""
+        return await self._dispatch(lambda session: session.list_resources(*args, **kwargs))
+
+    async def list_resource_templates(self, *args: Any, **kwargs: Any) -> types.ListResourceTemplatesResult:
+        """Send a resources/templates/list request to a worker."""
+        return await self._dispatch(lambda session: session.list_resource_templates(*args, **kwargs))
+
+    async def read_resource(self, uri: AnyUrl) -> types.ReadResourceResult:
+        """Send a resources/read request to a worker."""
+        return await self._dispatch(lambda session: session.read_resource(uri))
+
+    async def subscribe_resource(self, uri: AnyUrl) -> types.EmptyResult:
+        """Subscribe to resource updates on all workers."""
+        results = await asyncio.gather(*(self._on_worker(w, lambda s: s.subscribe_resource(uri)) for w in self.workers))
+        return results[0]
+
+    async def unsubscribe_resource(self, uri: AnyUrl) -> types.EmptyResult:
+        """Unsubscribe from resource updates on all workers."""
+        results = await asyncio.gather(
+            *(self._on_worker(w, lambda s: s.unsubscribe_resource(uri)) for w in self.workers)
+        )
+        return results[0]
+
+    async def set_logging_level(self, level: types.LoggingLevel) -> types.EmptyResult:
+        """Set the logging level on all workers."""
+        results = await asyncio.gather(
+            *(self._on_worker(w, lambda s: s.set_logging_level(level)) for w in self.workers)
+        )
+        return results[0]
+
+    async def send_progress_notification(self, progress_token: types.ProgressToken, *args: Any, **kwargs: Any) -> None:
+        """Forward a progress notification to the worker that sent the request with the progress token.
+
+        Progress of an unknown token is sent to all workers in rotation; those not knowing the token ignore it.
+        """
+        owner = self._progress_owners.get(progress_token)
+        workers = [owner] if owner is not None else await self._wait_ready()
+        await asyncio.gather(
+            *(
+                self._on_worker(w, lambda s: s.send_progress_notification(progress_token, *args, **kwargs))
+                for w in workers
+            )
+        )
+
+    async def complete(self, *args: Any, **kwargs: Any) -> types.CompleteResult:
+        """Send a completion/complete request to a worker."""
+        return await self._dispatch(lambda session: session.complete(*args, **kwargs))
+
+    @staticmethod
+    async def _on_worker(worker: UpstreamWorker, call: Callable[[ClientSession], Awaitable[Any]]) -> Any:
+        # A worker that crashed is restarting; do not wait forever for one that never comes back
+        try:
+            await asyncio.wait_for(worker.ready.wait(), UPSTREAM_POOL_READY_TIMEOUT_SECS)
+        except TimeoutError:
+            raise RuntimeError(f'Upstream worker {worker.index} is not ready') from None
+        if worker.session is None:
+            raise RuntimeError(f'Upstream worker {worker.index} is not connected')
+        return await call(worker.session)
@@ -0,0 +1,65 @@
+"""Validation of tool call arguments against the input schemas of the upstream tools.
+
+Validators are compiled once from the `inputSchema` of every tool whenever the tools are listed, so that
+malformed calls (common with LLM clients) are rejected by the proxy without a round trip to the upstream
+MCP server.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Any
+
+from jsonschema import SchemaError
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+if TYPE_CHECKING:
+    from jsonschema.protocols import Validator
+    from mcp import types
+
+logger = logging.getLogger('apify')
+
+
+class ToolArgumentValidator:
+    """Validators of tool call arguments, compiled from the input schemas of the listed tools.
+
+    Calls of tools whose schema is not known (the tools were not listed yet) or is invalid are not validated.
+
+    Attributes:
+        validated: Number of tool calls whose arguments were validated
+        rejected: Number of tool calls rejected because of invalid arguments
+    """
+
+    def __init__(self) -> None:
+        self.validated = 0
+        self.rejected = 0
+        # tool name -> compiled validator of its input schema
+        self._validators: dict[str, Validator] = {}
+
+    def update(self, tools: list[types.Tool], *, replace: bool = True) -> None:
+        """Compile validators of the given tools, replacing the previously known ones unless `replace` is False."""
+        validators: dict[str, Validator] = {} if replace else dict(self._validators)
+        for tool in tools:
+            try:
+                validator_class = validator_for(tool.inputSchema)
+                validator_class.check_schema(tool.inputSchema)
+                validators[tool.name] = validator_class(tool.inputSchema)
+            except SchemaError as e:
+                logger.warning(f"Invalid input schema of tool '{tool.name}', its arguments are not validated: {e}")
+        self._validators = validators
+
+    def validate(self, tool_name: str, arguments: dict[str, Any]) -> str | None:
+        """Return a description of the first problem found in the arguments, or None if they are valid."""
+        validator = self._validators.get(tool_name)
+        if validator is None:
+            return None
+
+        self.validated += 1
+        error = best_match(validator.iter_errors(arguments))
+        if error is None:
+            return None
+
+        self.rejected += 1
+        location = '/'.join(str(part) for part in error.absolute_path)
+        return f'{error.message} (at {location})' if location else error.message